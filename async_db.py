@@ -0,0 +1,107 @@
+### Async database access for the async views (ASYNC_VIEWS) ###
+# The async views read through an async engine -- asyncpg on PostgreSQL, aiosqlite on SQLite -- so queries that
+# do not depend on each other can run at the same time on separate connections.
+# Flask runs async views through async_to_sync below: every async view in a worker process runs on one shared
+# event loop, so the async connection pool is kept between requests instead of being rebuilt for each one.
+# This is not an ASGI entry point: the WSGI request thread waits for its view to finish, so this cuts the latency
+# of a page by overlapping its queries, but does not change how many requests a worker can serve at once.
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+from functools import wraps
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+# Async driver used for each database backend
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+### Turn a database URL into the matching async one, e.g. postgresql:// -> postgresql+asyncpg:// ###
+def async_url(uri):
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError("No async driver for '{0}' databases".format(backend))
+    return url.set(drivername="{0}+{1}".format(backend, ASYNC_DRIVERS[backend]))
+
+
+class AsyncDatabase:
+    def __init__(self, app=None):
+        self.engine = None
+        self.sessions = None
+        self.loop = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ASYNC_VIEWS", False)
+        app.config.setdefault("ASYNC_DATABASE_URI", None)
+        if app.config["ASYNC_VIEWS"]:
+            self.configure(app.config["ASYNC_DATABASE_URI"] or async_url(app.config["SQLALCHEMY_DATABASE_URI"]))
+        app.async_to_sync = self.async_to_sync
+
+    # Point the async views at a database (None closes the engine)
+    def configure(self, uri):
+        if self.engine is not None:
+            self.run(self.engine.dispose())
+        self.engine = create_async_engine(uri) if uri is not None else None
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False) if uri is not None else None
+
+    @property
+    def enabled(self):
+        return self.engine is not None
+
+    # The worker's event loop, started on first use (after the server has forked its workers)
+    def event_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="async-views", daemon=True).start()
+            return self.loop
+
+    # Run a coroutine on the worker's event loop and wait for its result.
+    # It runs in a copy of the caller's context, so Flask's request, session and g work inside it.
+    def run(self, coroutine):
+        loop = self.event_loop()
+        context = contextvars.copy_context()
+        future = Future()
+
+        def finish(task):
+            if task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        loop.call_soon_threadsafe(lambda: loop.create_task(coroutine, context=context).add_done_callback(finish))
+        return future.result()
+
+    # Used by Flask to call async views from its (sync) request handling
+    def async_to_sync(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+        return wrapper
+
+    # Run blocking code (e.g. a view that writes through the sync session) in a worker thread
+    async def run_sync(self, func, *args):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: context.run(func, *args))
+
+    ### Each call uses its own session (and connection), so several can be awaited together with asyncio.gather ###
+    async def scalar(self, statement):
+        async with self.sessions() as async_session:
+            return (await async_session.execute(statement)).scalar()
+
+    async def scalars(self, statement):
+        async with self.sessions() as async_session:
+            return (await async_session.execute(statement)).scalars().all()
+
+    async def all(self, statement):
+        async with self.sessions() as async_session:
+            return (await async_session.execute(statement)).all()
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,64 @@
+### Login hashing throughput as the hashing pool grows ###
+# Usage:
+#   python -m benchmarks.hashing                       (pool sizes 1, 2, 4 ... up to the number of cores)
+#   python -m benchmarks.hashing --workers 1,8 --logins 500
+# Each run checks `logins` passwords through the pool from many client threads at once, like a burst of logins.
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from werkzeug.security import generate_password_hash
+
+from hashing import PasswordHasher
+
+PASSWORD = "benchmark123"
+
+
+# Pool sizes 1, 2, 4 ... up to cores (and cores itself)
+def default_workers():
+    cores = os.cpu_count() or 1
+    sizes = []
+    size = 1
+    while size < cores:
+        sizes.append(size)
+        size *= 2
+    return sizes + [cores]
+
+
+### Return password checks per second for each pool size ###
+def run(workers, logins, method="scrypt:32768:8:1"):
+    stored_hash = generate_password_hash(PASSWORD, method)
+    results = {}
+    for size in workers:
+        hasher = PasswordHasher()
+        # Enough queue for every client, so the run measures throughput rather than rejections
+        hasher.configure(method, size, queue_depth=logins)
+        hasher.verify(stored_hash, PASSWORD)
+
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=4 * size) as clients:
+            checks = list(clients.map(lambda _: hasher.verify(stored_hash, PASSWORD), range(logins)))
+        seconds = perf_counter() - start
+        hasher.configure(method, 0)
+
+        assert all(checks)
+        results[size] = round(logins / seconds, 1)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure password checks per second for each hashing pool size")
+    parser.add_argument("--workers", type=lambda value: [int(size) for size in value.split(",")],
+                        default=default_workers())
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--method", default="scrypt:32768:8:1")
+    args = parser.parse_args(argv)
+
+    print("{0:>8} {1:>12}".format("workers", "logins/s"))
+    for size, rate in run(args.workers, args.logins, args.method).items():
+        print("{0:>8} {1:>12}".format(size, rate))
+
+
+if __name__ == "__main__":
+    main()
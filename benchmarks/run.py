@@ -0,0 +1,177 @@
+### Route benchmarks -- p50/p95/p99 latency and query count per route ###
+# Usage:
+#   DATABASE_URL=postgresql://... python -m benchmarks.run --seed --scale production
+#   python -m benchmarks.run --check             (fail if slower than benchmarks/baseline.json)
+#   python -m benchmarks.run --write-baseline    (record this run as the new baseline)
+# Without DATABASE_URL the benchmark uses a throwaway SQLite file.
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+db_is_throwaway = "DATABASE_URL" not in os.environ
+if db_is_throwaway:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "benchmark.db")
+
+from sqlalchemy import event, func
+
+from app import app, db, User, Habit, cache
+from benchmarks.seed import seed, SCALES, PASSWORD
+
+# The benchmark logs users in by writing their session directly
+app.secret_key = app.secret_key or "benchmark"
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# A route may be this much slower (p95) than the baseline before the check fails
+LATENCY_TOLERANCE = 0.5
+
+
+# Return the value at the given percentile of a sorted list
+def percentile(values, pct):
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+### Build one request per iteration for each route, using random users from the seeded data ###
+def route_requests(rng, user_ids, habits_by_user, usernames):
+    def pick_user():
+        return rng.choice(user_ids)
+
+    def home():
+        return pick_user(), "GET", "/", None
+
+    def stats():
+        user_id = rng.choice([user for user in user_ids if habits_by_user.get(user)])
+        return user_id, "GET", "/stats/{0}".format(rng.choice(habits_by_user[user_id])), None
+
+    def profile():
+        return pick_user(), "GET", "/profile/{0}".format(rng.choice(usernames)), None
+
+    def search():
+        return pick_user(), "POST", "/search", {"username": rng.choice(usernames)[:3]}
+
+    def mark_done():
+        user_id = rng.choice([user for user in user_ids if habits_by_user.get(user)])
+        return user_id, "POST", "/done/{0}".format(rng.choice(habits_by_user[user_id])), None
+
+    def login():
+        return None, "POST", "/login", {"username": rng.choice(usernames), "password": PASSWORD}
+
+    def follow():
+        return pick_user(), "POST", "/follow/{0}".format(rng.choice(usernames)), None
+
+    return {"home": home, "stats": stats, "profile": profile, "search": search,
+            "mark_done": mark_done, "login": login, "follow": follow}
+
+
+def run(iterations, sample_users=200, seed_value=0):
+    rng = random.Random(seed_value)
+    client = app.test_client()
+
+    # Sample users so every run hits the same accounts
+    with app.app_context():
+        max_id = db.session.query(func.max(User.id)).scalar()
+        user_ids = sorted(rng.sample(range(1, max_id + 1), min(sample_users, max_id)))
+        usernames = [username for (username,) in db.session.query(User.username).filter(User.id.in_(user_ids))]
+        habits_by_user = {}
+        for habit_id, user_id in db.session.query(Habit.id, Habit.user_id).filter(Habit.user_id.in_(user_ids)):
+            habits_by_user.setdefault(user_id, []).append(habit_id)
+
+    # Count statements issued during each request
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    results = {}
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    # Every benchmark request comes from one address, which the rate limiter would soon turn away
+    rate_limit_enabled = app.config["RATELIMIT_ENABLED"]
+    app.config["RATELIMIT_ENABLED"] = False
+    try:
+        for name, make_request in route_requests(rng, user_ids, habits_by_user, usernames).items():
+            timings = []
+            query_counts = []
+            for _ in range(iterations):
+                user_id, method, path, data = make_request()
+                with client.session_transaction() as sess:
+                    sess.clear()
+                    if user_id is not None:
+                        sess["user_id"] = user_id
+                del statements[:]
+                start = perf_counter()
+                client.open(path, method=method, data=data)
+                timings.append((perf_counter() - start) * 1000)
+                query_counts.append(len(statements))
+            timings.sort()
+            results[name] = {"p50_ms": round(percentile(timings, 50), 3), "p95_ms": round(percentile(timings, 95), 3),
+                             "p99_ms": round(percentile(timings, 99), 3), "queries": max(query_counts)}
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        app.config["RATELIMIT_ENABLED"] = rate_limit_enabled
+    return results
+
+
+### Compare a run against the baseline -- returns a list of regressions ###
+def compare(results, baseline):
+    failures = []
+    for name, expected in baseline["routes"].items():
+        actual = results.get(name)
+        if actual is None:
+            continue
+        if actual["queries"] > expected["queries"]:
+            failures.append("{0}: {1} queries per request, baseline is {2}".format(
+                name, actual["queries"], expected["queries"]))
+        if actual["p95_ms"] > expected["p95_ms"] * (1 + LATENCY_TOLERANCE):
+            failures.append("{0}: p95 {1}ms, baseline is {2}ms".format(name, actual["p95_ms"], expected["p95_ms"]))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every route against seeded data")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", action="store_true", help="create tables and generate data first")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--check", action="store_true", help="exit 1 if slower than the baseline")
+    parser.add_argument("--write-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.seed or db_is_throwaway:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed(**SCALES[args.scale])
+        # The shared cache outlives the database, and new users start at the same versions
+        cache.clear()
+
+    results = run(args.iterations)
+    print("{0:<10} {1:>9} {2:>9} {3:>9} {4:>8}".format("route", "p50 ms", "p95 ms", "p99 ms", "queries"))
+    for name, row in results.items():
+        print("{0:<10} {1:>9} {2:>9} {3:>9} {4:>8}".format(name, row["p50_ms"], row["p95_ms"], row["p99_ms"],
+                                                          row["queries"]))
+
+    if args.write_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({"scale": args.scale, "routes": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.check:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        if baseline["scale"] != args.scale:
+            sys.exit("Baseline was recorded at scale '{0}'".format(baseline["scale"]))
+        failures = compare(results, baseline)
+        if failures:
+            print("\nREGRESSIONS:")
+            for failure in failures:
+                print("  " + failure)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+### Seeded synthetic data generator for benchmarks ###
+# Fills the configured database with users, habits, activity logs and a follower graph.
+# Same seed + same scale = same data, so benchmark runs can be compared.
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import insert, update, text
+from werkzeug.security import generate_password_hash
+
+from app import db, User, Habit, ActivityLog, followers
+
+# Every generated user shares this password so login can be benchmarked
+PASSWORD = "benchmark123"
+
+# Roughly production sized: 100k users, 500k habits, ~30M logs, ~3M follow edges
+SCALES = {
+    "tiny": dict(users=20, habits_per_user=3, days=30, follows_per_user=5),
+    "small": dict(users=1000, habits_per_user=5, days=120, follows_per_user=20),
+    "production": dict(users=100000, habits_per_user=5, days=365, follows_per_user=30),
+}
+
+
+# Insert rows in chunks so memory stays bounded no matter the scale
+def insert_chunks(table, rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            db.session.execute(insert(table), chunk)
+            db.session.commit()
+            chunk = []
+    if chunk:
+        db.session.execute(insert(table), chunk)
+        db.session.commit()
+
+
+def seed(users, habits_per_user, days, follows_per_user, seed=0, chunk_size=10000, log=print):
+    rng = random.Random(seed)
+    today = date.today()
+    password = generate_password_hash(PASSWORD)
+
+    log("Creating {0} users".format(users))
+    insert_chunks(User.__table__, ({"id": user_id, "username": "user{0}".format(user_id), "password": password}
+                                   for user_id in range(1, users + 1)), chunk_size)
+
+    # Habits: created at a random point in the window, with a completion rate that varies per habit
+    habit_rows = []
+    for user_id in range(1, users + 1):
+        for _ in range(habits_per_user):
+            age = rng.randrange(days)
+            habit_rows.append({"id": len(habit_rows) + 1, "name": "habit{0}".format(len(habit_rows) + 1),
+                               "user_id": user_id, "date_created": today - timedelta(days=age), "streak": 0,
+                               "rate": rng.uniform(0.2, 0.95), "age": age})
+
+    log("Creating {0} habits".format(len(habit_rows)))
+    insert_chunks(Habit.__table__, ({key: habit[key] for key in ("id", "name", "user_id", "date_created", "streak")}
+                                    for habit in habit_rows), chunk_size)
+
+    # Logs: walk each habit day by day and track the streak ending at its last completion
+    def logs():
+        for habit in habit_rows:
+            habit["last_done"] = None
+            for days_ago in range(habit["age"], -1, -1):
+                if rng.random() < habit["rate"]:
+                    done = today - timedelta(days=days_ago)
+                    if habit["last_done"] == done - timedelta(days=1):
+                        habit["streak"] += 1
+                    else:
+                        habit["streak"] = 1
+                    habit["last_done"] = done
+                    yield {"habit_id": habit["id"], "date": done}
+
+    log("Creating activity logs")
+    insert_chunks(ActivityLog.__table__, logs(), chunk_size)
+
+    # Write the streaks found while generating logs back to the habits
+    log("Updating streaks")
+    for start in range(0, len(habit_rows), chunk_size):
+        db.session.execute(update(Habit), [{"id": habit["id"], "streak": habit["streak"], "last_done": habit["last_done"]}
+                                           for habit in habit_rows[start:start + chunk_size]])
+        db.session.commit()
+
+    # Follower graph: a few popular accounts attract a large share of follows
+    log("Creating follower graph")
+    def edges():
+        for follower_id in range(1, users + 1):
+            followed = set()
+            for _ in range(min(follows_per_user, users - 1)):
+                followed_id = int(users * rng.paretovariate(1.2)) % users + 1
+                if followed_id != follower_id and followed_id not in followed:
+                    followed.add(followed_id)
+                    yield {"follower_id": follower_id, "followed_id": followed_id}
+    insert_chunks(followers, edges(), chunk_size)
+
+    # Users and habits were given explicit ids, so move PostgreSQL's id sequences past them -- otherwise the
+    # first registration or new habit would be handed id 1 again
+    if db.engine.dialect.name == "postgresql":
+        for table in (User.__table__, Habit.__table__):
+            db.session.execute(text("SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                                    "(SELECT MAX(id) FROM \"{0}\"))".format(table.name)),
+                               {"table": '"{0}"'.format(table.name)})
+        db.session.commit()
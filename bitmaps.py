@@ -0,0 +1,79 @@
+### Completion bitmaps -- one row per habit per year instead of one row per completion ###
+# Bit n of a year's bitmap is set when the habit was completed on day n of that year (Jan 1 = bit 0).
+# The 366 bits are stored as 6 BIGINT words of 61 bits each, so no word ever needs the sign bit.
+# Counts are popcounts and streaks are bit scans, so stats never touch more than one row per year.
+from datetime import date, timedelta
+from functools import lru_cache
+
+WORD_BITS = 61
+WORDS = 6
+WORD_COLUMNS = ["word{0}".format(word) for word in range(WORDS)]
+
+
+### Year, word column and bit mask for a day ###
+def day_position(day):
+    index = day.timetuple().tm_yday - 1
+    return day.year, WORD_COLUMNS[index // WORD_BITS], 1 << (index % WORD_BITS)
+
+
+# Join a year's words into one 366-bit number (bit n = day n of the year)
+def year_bits(words):
+    bits = 0
+    for word, value in enumerate(words):
+        bits |= (value or 0) << (word * WORD_BITS)
+    return bits
+
+
+# Bits for every 7th day starting at day `offset` of the year
+@lru_cache(maxsize=None)
+def every_seventh_day(offset):
+    mask = 0
+    for index in range(offset, WORDS * WORD_BITS, 7):
+        mask |= 1 << index
+    return mask
+
+
+### Completions per weekday (0 = Monday) across bitmap rows of (year, word0 ... word5) ###
+def weekday_counts(rows):
+    counts = [0] * 7
+    for year, *words in rows:
+        bits = year_bits(words)
+        first_weekday = date(year, 1, 1).weekday()
+        for weekday in range(7):
+            counts[weekday] += (bits & every_seventh_day((weekday - first_weekday) % 7)).bit_count()
+    return counts
+
+
+### Streak of consecutive days ending on the latest completion, and that completion ###
+# years maps year -> 366-bit number; returns (0, None) when nothing was ever completed
+def streak_and_last_done(years):
+    completed_years = sorted((year for year, bits in years.items() if bits), reverse=True)
+    if not completed_years:
+        return 0, None
+    year = completed_years[0]
+    last_index = years[year].bit_length() - 1
+    last_done = date(year, 1, 1) + timedelta(days=last_index)
+
+    # The run of set bits ending at `index` is found from the highest clear bit below it
+    streak = 0
+    index = last_index
+    while True:
+        clear_bits = ~years.get(year, 0) & ((1 << (index + 1)) - 1)
+        if clear_bits:
+            return streak + index - (clear_bits.bit_length() - 1), last_done
+        # Every day up to Jan 1 was completed -- carry on from Dec 31 of the year before
+        streak += index + 1
+        year -= 1
+        index = date(year, 12, 31).timetuple().tm_yday - 1
+
+
+### Dates set in a year's words, in order ###
+def completed_days(year, words):
+    bits = year_bits(words)
+    first_day = date(year, 1, 1)
+    days = []
+    while bits:
+        lowest = bits & -bits
+        days.append(first_day + timedelta(days=lowest.bit_length() - 1))
+        bits ^= lowest
+    return days
@@ -0,0 +1,150 @@
+### Cache for rendered page fragments ###
+# Backends:
+#   sqlite -- one SQLite file shared by every worker on the host (default); the default path is in /dev/shm,
+#             so it lives in shared memory and never touches the disk
+#   memory -- LRU with a TTL inside each worker process
+#   none   -- caching switched off
+# Values are strings. Hit/miss counters are kept per worker process.
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import monotonic, time
+
+
+class Cache:
+    name = "none"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.load(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def load(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    # Prometheus lines for /metrics
+    def metrics(self):
+        return ["# HELP habittracker_cache_hits_total Fragment cache hits",
+                "# TYPE habittracker_cache_hits_total counter",
+                'habittracker_cache_hits_total{{backend="{0}"}} {1}'.format(self.name, self.hits),
+                "# HELP habittracker_cache_misses_total Fragment cache misses",
+                "# TYPE habittracker_cache_misses_total counter",
+                'habittracker_cache_misses_total{{backend="{0}"}} {1}'.format(self.name, self.misses)]
+
+
+### In-process LRU -- least recently used entries are dropped once max_entries is reached ###
+class LRUCache(Cache):
+    name = "memory"
+
+    def __init__(self, max_entries=10000, ttl=300):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def load(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+### SQLite file shared by all workers on the host ###
+class SQLiteCache(Cache):
+    name = "sqlite"
+
+    # Expired rows are purged once every this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, path, ttl=300):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        self.writes = 0
+        with self.connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                               "expires REAL NOT NULL)")
+
+    # One connection per thread, opened in autocommit mode
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self.local.connection = connection
+        return self.local.connection
+
+    def load(self, key):
+        row = self.connection().execute("SELECT value FROM cache WHERE key = ? AND expires > ?",
+                                        (key, time())).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key, value):
+        connection = self.connection()
+        connection.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                           (key, value, time() + self.ttl))
+        self.writes += 1
+        if self.writes % self.PURGE_EVERY == 0:
+            connection.execute("DELETE FROM cache WHERE expires <= ?", (time(),))
+
+    def delete(self, *keys):
+        if keys:
+            self.connection().execute("DELETE FROM cache WHERE key IN ({0})".format(", ".join("?" * len(keys))), keys)
+
+    def clear(self):
+        self.connection().execute("DELETE FROM cache")
+
+
+### Build the cache chosen by CACHE_BACKEND ###
+def create_cache(config):
+    backend = config.get("CACHE_BACKEND", "sqlite")
+    ttl = config.get("CACHE_TTL_SECONDS", 300)
+    if backend == "memory":
+        return LRUCache(config.get("CACHE_MAX_ENTRIES", 10000), ttl)
+    if backend == "sqlite":
+        default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else "."
+        return SQLiteCache(config.get("CACHE_SQLITE_PATH") or os.path.join(default_dir, "habittracker-cache.db"), ttl)
+    if backend == "none":
+        return Cache()
+    raise ValueError("Unknown CACHE_BACKEND '{0}'".format(backend))
@@ -0,0 +1,96 @@
+### Password hashing on a bounded process pool ###
+# Hashing is deliberately slow CPU work. Running it in the request worker lets a burst of logins starve every
+# other route, so hashes are computed in a pool of PASSWORD_HASH_WORKERS processes instead. At most
+# PASSWORD_HASH_QUEUE_DEPTH hashes may be running or waiting at once; past that, requests are turned away
+# straight away with 503 and Retry-After rather than queueing behind the burst.
+# PASSWORD_HASH_WORKERS = 0 hashes inline in the request worker (used by the tests).
+# Every server worker process has its own pool, so server workers x PASSWORD_HASH_WORKERS should not exceed the
+# host's cores -- the default is a small fixed pool rather than one process per core.
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.pool = None
+        self.slots = None
+        self.rejected = 0
+        self.retry_after = 1
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+        app.config.setdefault("PASSWORD_HASH_WORKERS", 2)
+        app.config.setdefault("PASSWORD_HASH_QUEUE_DEPTH", 4 * app.config["PASSWORD_HASH_WORKERS"])
+        app.config.setdefault("PASSWORD_HASH_RETRY_AFTER", 1)
+        self.retry_after = app.config["PASSWORD_HASH_RETRY_AFTER"]
+        self.configure(app.config["PASSWORD_HASH_METHOD"], app.config["PASSWORD_HASH_WORKERS"],
+                       app.config["PASSWORD_HASH_QUEUE_DEPTH"])
+        app.register_error_handler(HasherBusy, self.busy)
+
+    # Change hash parameters and pool size
+    def configure(self, method, workers, queue_depth=None):
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.method = method
+        # Stored hashes start with the method in full -- werkzeug fills in the defaults of short forms,
+        # e.g. scrypt -> scrypt:32768:8:1 and pbkdf2:sha256 -> pbkdf2:sha256:1000000
+        self.hash_prefix = generate_password_hash("", method).split("$", 1)[0]
+        self.workers = workers
+        self.queue_depth = queue_depth or 4 * max(workers, 1)
+        self.pool = None
+        self.slots = threading.BoundedSemaphore(self.queue_depth)
+
+    # Run one hashing call in the pool -- or inline when the pool is switched off
+    def submit(self, func, *args):
+        if self.workers == 0:
+            return func(*args)
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HasherBusy()
+        try:
+            with self.lock:
+                # Started on first use, so each server worker process gets its own pool after forking. The pool
+                # processes are spawned, not forked: a fork of this threaded process could inherit locks held
+                # by other request threads and hang.
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+            return self.pool.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self.submit(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self.submit(check_password_hash, stored_hash, password)
+
+    # Stored hashes made with other parameters (e.g. before PASSWORD_HASH_METHOD was raised) should be redone
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split("$", 1)[0] != self.hash_prefix
+
+    def busy(self, error):
+        return "Too many logins right now, please try again shortly", 503, {"Retry-After": str(self.retry_after)}
+
+    # Prometheus lines for /metrics
+    def metrics(self):
+        return ["# HELP habittracker_password_hash_rejected_total Hashing requests turned away because the pool was full",
+                "# TYPE habittracker_password_hash_rejected_total counter",
+                "habittracker_password_hash_rejected_total {0}".format(self.rejected),
+                "# HELP habittracker_password_hash_queue_depth Hashing requests the pool accepts at once",
+                "# TYPE habittracker_password_hash_queue_depth gauge",
+                "habittracker_password_hash_queue_depth {0}".format(self.queue_depth)]
+
+
+hasher = PasswordHasher()
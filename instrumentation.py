@@ -0,0 +1,189 @@
+### Per-request SQL instrumentation -- query counts, timings and a slow-query log ###
+# Opt in with SQL_INSTRUMENTATION = True. Metrics are kept per worker process and served at /metrics
+# in Prometheus text format to scrapers sending METRICS_TOKEN as a bearer token.
+import hmac
+import heapq
+import json
+import logging
+import threading
+from time import perf_counter
+
+from flask import g, request, current_app, has_request_context, before_render_template, template_rendered, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_log = logging.getLogger("habittracker.slow_queries")
+
+# Histogram buckets for seconds spent in the database / rendering, and for statements per request
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+### Cumulative histogram in the shape Prometheus expects ###
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def lines(self, name, labels):
+        lines = []
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, bound, count))
+        lines.append('{0}_bucket{{{1},le="+Inf"}} {2}'.format(name, labels, self.count))
+        lines.append('{0}_sum{{{1}}} {2}'.format(name, labels, self.sum))
+        lines.append('{0}_count{{{1}}} {2}'.format(name, labels, self.count))
+        return lines
+
+
+### Totals for one endpoint ###
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.query_count = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = Histogram(SECONDS_BUCKETS)
+        self.render_seconds = Histogram(SECONDS_BUCKETS)
+        # Min-heap of (seconds, statement) holding the slowest statements seen
+        self.slowest = []
+
+
+# Escape a value for use inside a Prometheus label
+def label_value(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class SQLInstrumentation:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SQL_INSTRUMENTATION", False)
+        app.config.setdefault("METRICS_TOKEN", None)
+        app.config.setdefault("SLOW_QUERY_THRESHOLD_MS", 100)
+        app.config.setdefault("SLOWEST_QUERIES_PER_ENDPOINT", 5)
+
+        # Hooks are always installed but do nothing unless instrumentation is switched on
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+        before_render_template.connect(self.before_render, app)
+        template_rendered.connect(self.after_render, app)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics)
+
+    # Add a function returning extra Prometheus lines to /metrics
+    def register_collector(self, collector):
+        self.collectors.append(collector)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+    def active(self):
+        return has_request_context() and "sql_queries" in g
+
+    def start_request(self):
+        if current_app.config["SQL_INSTRUMENTATION"]:
+            g.sql_queries = 0
+            g.sql_seconds = 0
+            g.sql_statements = []
+            g.render_seconds = 0
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active():
+            conn.info.setdefault("query_start", []).append(perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.active() or not conn.info.get("query_start"):
+            return
+        seconds = perf_counter() - conn.info["query_start"].pop()
+        g.sql_queries += 1
+        g.sql_seconds += seconds
+        g.sql_statements.append((seconds, statement))
+
+        # Log statements over the threshold -- parameters are left out so passwords never reach the log
+        if seconds * 1000 >= current_app.config["SLOW_QUERY_THRESHOLD_MS"]:
+            slow_query_log.warning(json.dumps({"endpoint": request.endpoint, "method": request.method,
+                                               "duration_ms": round(seconds * 1000, 3), "statement": statement}))
+
+    def before_render(self, sender, template, context, **extra):
+        if self.active():
+            g.render_start = perf_counter()
+
+    def after_render(self, sender, template, context, **extra):
+        if self.active() and "render_start" in g:
+            g.render_seconds += perf_counter() - g.pop("render_start")
+
+    def finish_request(self, response):
+        if not self.active() or request.endpoint == "metrics":
+            return response
+
+        keep = current_app.config["SLOWEST_QUERIES_PER_ENDPOINT"]
+        with self.lock:
+            stats = self.endpoints.setdefault(request.endpoint or "unknown", EndpointStats())
+            stats.requests += 1
+            stats.queries += g.sql_queries
+            stats.query_count.observe(g.sql_queries)
+            stats.db_seconds.observe(g.sql_seconds)
+            stats.render_seconds.observe(g.render_seconds)
+            for entry in g.sql_statements:
+                if len(stats.slowest) < keep:
+                    heapq.heappush(stats.slowest, entry)
+                elif entry[0] > stats.slowest[0][0]:
+                    heapq.heapreplace(stats.slowest, entry)
+        return response
+
+    ### /metrics -- aggregated counters and histograms in Prometheus text format ###
+    # The page includes SQL text, so it is only served with the token -- without one configured it is not served
+    def metrics(self):
+        token = current_app.config["METRICS_TOKEN"]
+        if not current_app.config["SQL_INSTRUMENTATION"] or not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), "Bearer {0}".format(token)):
+            abort(401)
+
+        lines = []
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines += ["# HELP habittracker_requests_total Requests handled per endpoint",
+                      "# TYPE habittracker_requests_total counter"]
+            for name, stats in endpoints:
+                lines.append('habittracker_requests_total{{endpoint="{0}"}} {1}'.format(name, stats.requests))
+
+            lines += ["# HELP habittracker_db_queries_total SQL statements executed per endpoint",
+                      "# TYPE habittracker_db_queries_total counter"]
+            for name, stats in endpoints:
+                lines.append('habittracker_db_queries_total{{endpoint="{0}"}} {1}'.format(name, stats.queries))
+
+            for metric, attribute, help_text in [
+                    ("habittracker_request_queries", "query_count", "SQL statements per request"),
+                    ("habittracker_db_seconds", "db_seconds", "Time spent in the database per request"),
+                    ("habittracker_render_seconds", "render_seconds", "Time spent rendering templates per request")]:
+                lines += ["# HELP {0} {1}".format(metric, help_text), "# TYPE {0} histogram".format(metric)]
+                for name, stats in endpoints:
+                    lines += getattr(stats, attribute).lines(metric, 'endpoint="{0}"'.format(name))
+
+            lines += ["# HELP habittracker_slowest_query_seconds Slowest SQL statements seen per endpoint",
+                      "# TYPE habittracker_slowest_query_seconds gauge"]
+            for name, stats in endpoints:
+                for rank, (seconds, statement) in enumerate(sorted(stats.slowest, reverse=True), start=1):
+                    lines.append('habittracker_slowest_query_seconds{{endpoint="{0}",rank="{1}",statement="{2}"}} {3}'
+                                 .format(name, rank, label_value(" ".join(statement.split())), seconds))
+
+        for collector in self.collectors:
+            lines += collector()
+
+        return "\n".join(lines) + "\n", 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
@@ -0,0 +1,49 @@
+### Friends leaderboard scores ###
+# A user's score is their activity streak (consecutive days on which they completed at least one habit) and
+# their consistency (days with a completion out of the last WINDOW_DAYS). Both are kept as
+# (streak, last_done, recent_days): recent_days is a bitmap of active days where bit k means
+# "active k days before last_done", so the score can be brought up to date without reading any logs.
+WINDOW_DAYS = 30
+WINDOW_MASK = (1 << WINDOW_DAYS) - 1
+
+EMPTY_SCORE = (0, None, 0)
+
+
+### Score after the user completes something on `day` (days are recorded in order) ###
+def record_day(score, day):
+    streak, last_done, recent_days = score
+    if last_done == day:
+        return score
+    if last_done is None:
+        return 1, day, 1
+    gap = (day - last_done).days
+    streak = streak + 1 if gap == 1 else 1
+    recent_days = (recent_days << gap) & WINDOW_MASK if gap < WINDOW_DAYS else 0
+    return streak, day, recent_days | 1
+
+
+### Score built from every day the user was active ###
+def score_from_days(days):
+    score = EMPTY_SCORE
+    for day in sorted(days):
+        score = record_day(score, day)
+    return score
+
+
+### (current streak, consistency %) as of today ###
+# A streak not extended today or yesterday is already broken; days older than the window no longer count.
+def standing(score, today):
+    streak, last_done, recent_days = score
+    if last_done is None:
+        return 0, 0
+    age = (today - last_done).days
+    current_streak = streak if age <= 1 else 0
+    days_in_window = (recent_days & ((1 << (WINDOW_DAYS - age)) - 1)).bit_count() if age < WINDOW_DAYS else 0
+    return current_streak, round(100 * days_in_window / WINDOW_DAYS)
+
+
+### Rank friends by current streak, then consistency, then name -- rows of (username, score) ###
+def rank(rows, today, limit):
+    ranked = [(username,) + standing(score, today) for username, score in rows]
+    ranked.sort(key=lambda entry: (-entry[1], -entry[2], entry[0].lower()))
+    return ranked[:limit]
@@ -0,0 +1,246 @@
+### Bring an existing database up to the current schema ###
+# db.create_all() only creates missing tables, it never changes tables that already exist.
+# Each migration below runs once per database and is recorded in the schema_migrations table.
+# Run them with: flask migrate
+from sqlalchemy import inspect, text
+
+# Number of activity_log ids scanned per transaction when removing duplicate logs
+DEDUPE_CHUNK_SIZE = 50000
+
+MIGRATIONS = []
+# Migrations of the sharded tables added since habit shards -- also run on every shard (HABIT_SHARD_URIS)
+SHARD_MIGRATIONS = []
+
+
+# Register a function as the next migration to run
+def migration(f):
+    MIGRATIONS.append(f)
+    return f
+
+
+# Register a migration that also runs on every shard, which only holds the sharded tables
+def shard_migration(f):
+    SHARD_MIGRATIONS.append(f)
+    return migration(f)
+
+
+### Add indexes used by home, profile and follow lookups ###
+@migration
+def add_lookup_indexes(engine, chunk_size, log):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_habit_user_id ON habit (user_id)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_followers_follower_id ON followers (follower_id)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_followers_followed_id ON followers (followed_id)"))
+
+
+### Remove duplicate logs and make (habit_id, date) unique ###
+@migration
+def dedupe_activity_logs(engine, chunk_size, log):
+    # Temporary index so each duplicate check is an index lookup instead of a table scan
+    with engine.begin() as connection:
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_activity_log_dedupe_tmp "
+                                "ON activity_log (habit_id, date, id)"))
+        low, high = connection.execute(text("SELECT MIN(id), MAX(id) FROM activity_log")).one()
+
+    # Keep the oldest log for each (habit_id, date) and delete the rest, one id range at a time
+    removed = 0
+    if low is not None:
+        for start in range(low, high + 1, chunk_size):
+            with engine.begin() as connection:
+                result = connection.execute(text(
+                    "DELETE FROM activity_log WHERE id >= :start AND id < :end AND EXISTS ("
+                    "SELECT 1 FROM activity_log AS keep WHERE keep.habit_id = activity_log.habit_id "
+                    "AND keep.date = activity_log.date AND keep.id < activity_log.id)"),
+                    {"start": start, "end": start + chunk_size})
+                removed += result.rowcount
+    log("Removed {0} duplicate activity logs".format(removed))
+
+    with engine.begin() as connection:
+        connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_activity_log_habit_id_date "
+                                "ON activity_log (habit_id, date)"))
+        connection.execute(text("DROP INDEX IF EXISTS ix_activity_log_dedupe_tmp"))
+
+
+### Make usernames unique regardless of case, served by an index on lower(username) ###
+# The old check was case-sensitive, so 'Tester' and 'tester' may both exist: the oldest account keeps its name
+# and the others get their id appended. Renames are logged so those users can be told their new username.
+@migration
+def add_username_lower_index(engine, chunk_size, log):
+    with engine.begin() as connection:
+        duplicates = connection.execute(text(
+            'SELECT id, username FROM "user" WHERE lower(username) IN '
+            '(SELECT lower(username) FROM "user" GROUP BY lower(username) HAVING COUNT(*) > 1) ORDER BY id')).all()
+        kept = set()
+        for user_id, username in duplicates:
+            if username.lower() not in kept:
+                kept.add(username.lower())
+                continue
+            new_name, attempt = username, 0
+            while connection.execute(text('SELECT 1 FROM "user" WHERE lower(username) = :name'),
+                                     {"name": new_name.lower()}).first() is not None:
+                # Usernames are at most 30 letters and numbers
+                suffix = str(user_id) + (str(attempt) if attempt else "")
+                new_name, attempt = username[:30 - len(suffix)] + suffix, attempt + 1
+            connection.execute(text('UPDATE "user" SET username = :name WHERE id = :id'), {"name": new_name, "id": user_id})
+            log("Renamed user {0} from {1} to {2}".format(user_id, username, new_name))
+        connection.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_user_username_lower ON "user" (lower(username))'))
+
+
+### Let the database delete logs with their habit, and habits and follows with their user ###
+@migration
+def add_cascading_foreign_keys(engine, chunk_size, log):
+    # SQLite cannot alter constraints in place -- SQLite is only used for development and tests,
+    # recreate those databases with db.create_all() to pick up the cascades
+    if engine.dialect.name != "postgresql":
+        log("Skipping cascading foreign keys on {0}".format(engine.dialect.name))
+        return
+
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in ["activity_log", "habit", "followers"]:
+            for foreign_key in inspector.get_foreign_keys(table):
+                if foreign_key["options"].get("ondelete", "").upper() == "CASCADE":
+                    continue
+                connection.execute(text(
+                    'ALTER TABLE {0} DROP CONSTRAINT "{1}", ADD CONSTRAINT "{1}" FOREIGN KEY ({2}) '
+                    'REFERENCES "{3}" ({4}) ON DELETE CASCADE'.format(
+                        table, foreign_key["name"], ", ".join(foreign_key["constrained_columns"]),
+                        foreign_key["referred_table"], ", ".join(foreign_key["referred_columns"]))))
+
+
+### Serve 'username contains ...' searches from a trigram index ###
+@migration
+def add_username_trigram_index(engine, chunk_size, log):
+    # pg_trgm is PostgreSQL only -- other databases page through the lower(username) index instead
+    if engine.dialect.name != "postgresql":
+        log("Skipping trigram index on {0}".format(engine.dialect.name))
+        return
+    with engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(text('CREATE INDEX IF NOT EXISTS ix_user_username_trgm ON "user" '
+                                'USING gin (lower(username) gin_trgm_ops)'))
+
+
+### Version counters behind the ETags on /stats and /profile ###
+@migration
+def add_version_columns(engine, chunk_size, log):
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in ["habit", "user"]:
+            columns = {column["name"] for column in inspector.get_columns(table)}
+            if "version" not in columns:
+                connection.execute(text('ALTER TABLE "{0}" ADD COLUMN version INTEGER NOT NULL DEFAULT 1'.format(table)))
+            if "updated_at" not in columns:
+                connection.execute(text('ALTER TABLE "{0}" ADD COLUMN updated_at TIMESTAMP'.format(table)))
+
+
+### Directory column recording which shard holds a user's habits ###
+@migration
+def add_user_shard_column(engine, chunk_size, log):
+    if "shard" not in {column["name"] for column in inspect(engine).get_columns("user")}:
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE "user" ADD COLUMN shard INTEGER'))
+
+
+### Completion bitmaps ###
+# The table starts empty -- to switch storage, set ACTIVITY_STORAGE to 'dual' and fill it with 'flask backfill-bitmaps'
+@shard_migration
+def add_activity_bitmaps(engine, chunk_size, log):
+    words = ", ".join("word{0} BIGINT NOT NULL DEFAULT 0".format(word) for word in range(6))
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE IF NOT EXISTS activity_bitmap (habit_id INTEGER NOT NULL "
+                                "REFERENCES habit (id) ON DELETE CASCADE, year INTEGER NOT NULL, {0}, "
+                                "PRIMARY KEY (habit_id, year))".format(words)))
+
+
+### Set the bitmap bit for every activity log, one range of habit ids at a time ###
+# Bits are OR-ed into existing rows, so this is safe to run again (e.g. at the end of a dual-write period).
+def backfill_activity_bitmaps(engine, chunk_size=DEDUPE_CHUNK_SIZE, log=print):
+    if engine.dialect.name == "postgresql":
+        year = "CAST(EXTRACT(YEAR FROM date) AS INTEGER)"
+        day = "(CAST(EXTRACT(DOY FROM date) AS INTEGER) - 1)"
+    else:
+        year = "CAST(STRFTIME('%Y', date) AS INTEGER)"
+        day = "(CAST(STRFTIME('%j', date) AS INTEGER) - 1)"
+    # Day n of the year is bit n % 61 of word n / 61 -- UNION drops days both live and archived (or archived
+    # twice), so the days are unique and summing bits is an OR
+    words = ", ".join("CAST(SUM(CASE WHEN {0} / 61 = {1} THEN CAST(1 AS BIGINT) << ({0} % 61) ELSE 0 END) AS BIGINT)"
+                      .format(day, word) for word in range(6))
+    merge = ", ".join("word{0} = activity_bitmap.word{0} | excluded.word{0}".format(word) for word in range(6))
+
+    # Rolled up logs count too, or their days would be lost once stats are read from the bitmaps
+    logs = ("(SELECT habit_id, date FROM activity_log UNION "
+            "SELECT habit_id, date FROM activity_log_archive) AS logs")
+
+    with engine.begin() as connection:
+        low, high = connection.execute(text("SELECT MIN(habit_id), MAX(habit_id) FROM {0}".format(logs))).one()
+    filled = 0
+    if low is not None:
+        for start in range(low, high + 1, chunk_size):
+            with engine.begin() as connection:
+                result = connection.execute(text(
+                    "INSERT INTO activity_bitmap (habit_id, year, word0, word1, word2, word3, word4, word5) "
+                    "SELECT habit_id, {0}, {1} FROM {3} "
+                    "WHERE habit_id >= :start AND habit_id < :end AND date IS NOT NULL "
+                    "GROUP BY habit_id, {0} "
+                    "ON CONFLICT (habit_id, year) DO UPDATE SET {2}".format(year, words, merge, logs)),
+                    {"start": start, "end": start + chunk_size})
+                filled += result.rowcount
+    log("Filled {0} completion bitmaps".format(filled))
+
+
+### Monthly roll-ups of old activity logs, and the archive the rolled up logs are moved to ###
+# The tables start empty -- 'flask rollup-activity' fills them
+@shard_migration
+def add_activity_rollups(engine, chunk_size, log):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE IF NOT EXISTS activity_rollup (habit_id INTEGER NOT NULL "
+                                "REFERENCES habit (id) ON DELETE CASCADE, month DATE NOT NULL, weekday INTEGER NOT NULL, "
+                                "count INTEGER NOT NULL, PRIMARY KEY (habit_id, month, weekday))"))
+        # Ids are generated as in db.create_all(): SERIAL on PostgreSQL, the rowid on SQLite
+        id_type = "SERIAL" if engine.dialect.name == "postgresql" else "INTEGER"
+        connection.execute(text("CREATE TABLE IF NOT EXISTS activity_log_archive (id {0} NOT NULL PRIMARY KEY, "
+                                "habit_id INTEGER NOT NULL REFERENCES habit (id) ON DELETE CASCADE, date DATE)"
+                                .format(id_type)))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_activity_log_archive_habit_id "
+                                "ON activity_log_archive (habit_id)"))
+
+
+### Flag for accounts whose feed events are read by followers instead of pushed to them ###
+# The feed tables themselves are new and are created by db.create_all()
+@migration
+def add_user_celebrity_column(engine, chunk_size, log):
+    if "celebrity" not in {column["name"] for column in inspect(engine).get_columns("user")}:
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE "user" ADD COLUMN celebrity BOOLEAN NOT NULL DEFAULT false'))
+
+
+### Index for paging through a habit's logs by id (/api/v1) ###
+@shard_migration
+def add_activity_log_cursor_index(engine, chunk_size, log):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_activity_log_habit_id_id ON activity_log (habit_id, id)"))
+
+
+### Counter numbering each user's change log (/api/v1/sync) -- the change_log table is created by db.create_all() ###
+@migration
+def add_user_change_seq_column(engine, chunk_size, log):
+    if "change_seq" not in {column["name"] for column in inspect(engine).get_columns("user")}:
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE "user" ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0'))
+
+
+### Run every migration that has not been applied to this database yet ###
+# Shards are upgraded with migrations=SHARD_MIGRATIONS and keep their own schema_migrations table
+def upgrade(engine, chunk_size=DEDUPE_CHUNK_SIZE, log=print, migrations=MIGRATIONS):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (name VARCHAR(100) PRIMARY KEY)"))
+        applied = set(connection.execute(text("SELECT name FROM schema_migrations")).scalars())
+
+    for step in migrations:
+        if step.__name__ in applied:
+            continue
+        log("Applying {0}".format(step.__name__))
+        step(engine, chunk_size, log)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": step.__name__})
@@ -0,0 +1,65 @@
+### In-process sorted index of usernames for prefix autocomplete ###
+# Lookups are a binary search, so typing into the search box never reaches the database.
+# Each worker keeps its own copy: new registrations are added as they happen in this worker,
+# and the whole index is reloaded every refresh_seconds to pick up changes made by other workers.
+import bisect
+import threading
+from time import monotonic
+
+
+class PrefixIndex:
+    def __init__(self, load, refresh_seconds=300):
+        # load() returns every username
+        self.load = load
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.keys = []
+        self.names = []
+        self.loaded_at = None
+
+    def rebuild(self):
+        entries = sorted((name.lower(), name) for name in self.load())
+        with self.lock:
+            self.keys = [key for key, name in entries]
+            self.names = [name for key, name in entries]
+            self.loaded_at = monotonic()
+
+    # Forget everything -- the next search reloads from the database
+    def invalidate(self):
+        with self.lock:
+            self.keys = []
+            self.names = []
+            self.loaded_at = None
+
+    def ensure_fresh(self):
+        if self.loaded_at is None or monotonic() - self.loaded_at > self.refresh_seconds:
+            self.rebuild()
+
+    def add(self, name):
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            index = bisect.bisect_left(self.keys, name.lower())
+            if index == len(self.keys) or self.keys[index] != name.lower():
+                self.keys.insert(index, name.lower())
+                self.names.insert(index, name)
+
+    def remove(self, name):
+        with self.lock:
+            index = bisect.bisect_left(self.keys, name.lower())
+            if index < len(self.keys) and self.keys[index] == name.lower():
+                del self.keys[index]
+                del self.names[index]
+
+    # Return up to limit usernames starting with prefix (case-insensitive), in alphabetical order
+    def search(self, prefix, limit=10):
+        self.ensure_fresh()
+        prefix = prefix.lower()
+        with self.lock:
+            start = bisect.bisect_left(self.keys, prefix)
+            results = []
+            for index in range(start, min(start + limit, len(self.keys))):
+                if not self.keys[index].startswith(prefix):
+                    break
+                results.append(self.names[index])
+            return results
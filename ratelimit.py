@@ -0,0 +1,191 @@
+### Token-bucket rate limiting for expensive routes ###
+# Each client gets a bucket per route and key (its IP address, and the username it is logging in as). A bucket
+# holds up to `count` tokens and refills at count / seconds tokens per second; every request takes one token,
+# and a request that finds its bucket empty is answered with 429 and Retry-After.
+# Backends:
+#   memory -- buckets inside each worker process (default)
+#   sqlite -- one SQLite file shared by every worker on the host (in /dev/shm by default), so a client
+#             cannot get around the limit by landing on a different worker
+#   none   -- rate limiting switched off
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import time
+
+from flask import request, current_app
+
+
+### Refill a bucket for the time since it was last used, then try to take one token ###
+# Returns the tokens left and 0, or the unchanged tokens and the seconds until the next token
+def take_token(tokens, updated, capacity, rate, now):
+    tokens = capacity if tokens is None else min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class Buckets:
+    name = "none"
+
+    # Take a token from the bucket -- returns 0, or the seconds to wait when it is empty
+    def take(self, key, capacity, rate):
+        return 0
+
+    def clear(self):
+        pass
+
+
+### In-process buckets -- least recently used buckets are dropped (which refills them) past max_entries ###
+class MemoryBuckets(Buckets):
+    name = "memory"
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, capacity, rate):
+        now = time()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (None, None))
+            tokens, wait = take_token(tokens, updated, capacity, rate, now)
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+### SQLite file shared by all workers on the host ###
+class SQLiteBuckets(Buckets):
+    name = "sqlite"
+
+    # Buckets idle this long are full again, so they are purged once every PURGE_EVERY writes
+    PURGE_EVERY = 1000
+    PURGE_IDLE_SECONDS = 3600
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.writes = 0
+        self.connection().execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                                  "updated REAL NOT NULL)")
+
+    # One connection per thread, opened in autocommit mode
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self.local.connection = connection
+        return self.local.connection
+
+    def take(self, key, capacity, rate):
+        connection = self.connection()
+        now = time()
+        # Read and update the bucket under the write lock so workers cannot both spend the last token
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, wait = take_token(row[0] if row else None, row[1] if row else None, capacity, rate, now)
+            connection.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                               (key, tokens, now))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        self.writes += 1
+        if self.writes % self.PURGE_EVERY == 0:
+            connection.execute("DELETE FROM buckets WHERE updated <= ?", (now - self.PURGE_IDLE_SECONDS,))
+        return wait
+
+    def clear(self):
+        self.connection().execute("DELETE FROM buckets")
+
+
+### Build the buckets chosen by RATELIMIT_BACKEND ###
+def create_buckets(config):
+    backend = config.get("RATELIMIT_BACKEND", "memory")
+    if backend == "memory":
+        return MemoryBuckets()
+    if backend == "sqlite":
+        default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else "."
+        return SQLiteBuckets(config.get("RATELIMIT_SQLITE_PATH") or os.path.join(default_dir, "habittracker-ratelimit.db"))
+    if backend == "none":
+        return Buckets()
+    raise ValueError("Unknown RATELIMIT_BACKEND '{0}'".format(backend))
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.buckets = Buckets()
+        self.lock = threading.Lock()
+        self.allowed = {}
+        self.limited = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMIT_BACKEND", "memory")
+        self.buckets = create_buckets(app.config)
+
+    ### Decorator limiting a view -- per_ip / per_username are (count, seconds), e.g. (10, 60) ###
+    # Only requests with one of `methods` are counted; the username comes from the submitted form.
+    def limit(self, name, per_ip=None, per_username=None, methods=("POST",)):
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if current_app.config["RATELIMIT_ENABLED"] and request.method in methods:
+                    checks = []
+                    if per_ip is not None:
+                        checks.append(("ip", request.remote_addr, per_ip))
+                    username = request.form.get("username", "").strip().lower()
+                    if per_username is not None and username:
+                        checks.append(("username", username, per_username))
+
+                    for key_type, key, (count, seconds) in checks:
+                        wait = self.buckets.take("{0}:{1}:{2}".format(name, key_type, key), count, count / seconds)
+                        if wait > 0:
+                            self.record(self.limited, (name, key_type))
+                            return ("Too many requests, please slow down", 429,
+                                    {"Retry-After": str(math.ceil(wait))})
+                    self.record(self.allowed, (name,))
+                return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, counter, labels):
+        with self.lock:
+            counter[labels] = counter.get(labels, 0) + 1
+
+    # Refill every bucket and zero the counters
+    def reset(self):
+        self.buckets.clear()
+        with self.lock:
+            self.allowed.clear()
+            self.limited.clear()
+
+    # Prometheus lines for /metrics
+    def metrics(self):
+        lines = ["# HELP habittracker_ratelimit_allowed_total Rate limited requests let through",
+                 "# TYPE habittracker_ratelimit_allowed_total counter"]
+        with self.lock:
+            for (name,), count in sorted(self.allowed.items()):
+                lines.append('habittracker_ratelimit_allowed_total{{route="{0}"}} {1}'.format(name, count))
+            lines += ["# HELP habittracker_ratelimit_limited_total Requests answered with 429, by bucket key",
+                      "# TYPE habittracker_ratelimit_limited_total counter"]
+            for (name, key_type), count in sorted(self.limited.items()):
+                lines.append('habittracker_ratelimit_limited_total{{route="{0}",key="{1}"}} {2}'
+                             .format(name, key_type, count))
+        return lines
+
+
+limiter = RateLimiter()
@@ -0,0 +1,87 @@
+### Read-replica routing ###
+# Views marked @read_only send their SELECTs to a replica; everything else (and every write) uses the primary.
+# After a client writes, its reads stay on the primary for REPLICA_STICKY_SECONDS so it always sees its own
+# changes even if the replicas are behind.
+import random
+from functools import wraps
+from time import time
+
+from flask import g, request, session, has_request_context, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.sql import Select
+
+from sharding import shards
+
+
+class ReplicaSet:
+    def __init__(self, app=None):
+        self.engines = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SQLALCHEMY_REPLICA_URIS", [])
+        app.config.setdefault("REPLICA_STICKY_SECONDS", 5)
+        self.configure(app.config["SQLALCHEMY_REPLICA_URIS"])
+        app.before_request(self.start_request)
+        app.after_request(self.remember_write)
+
+    # Replace the replica engines (an empty list sends everything to the primary)
+    def configure(self, uris):
+        for engine in self.engines:
+            engine.dispose()
+        self.engines = [create_engine(uri) for uri in uris]
+
+    # Pick a replica for this request, unless the client wrote recently
+    def choose(self):
+        if not self.engines:
+            return None
+        last_write = session.get("last_write")
+        if last_write is not None and time() - last_write < current_app.config["REPLICA_STICKY_SECONDS"]:
+            return None
+        return random.choice(self.engines)
+
+    def start_request(self):
+        g.replica = None
+        g.wrote = False
+
+    def remember_write(self, response):
+        if g.get("wrote"):
+            session["last_write"] = time()
+        return response
+
+
+### Session that sends reads from @read_only views to the replica chosen for the request, ###
+### and habit/log statements to the shard selected for the request                        ###
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            writing = self._flushing or (clause is not None and not isinstance(clause, Select))
+            if writing and has_request_context():
+                g.wrote = True
+
+            # Habits and logs live on the current user's shard (which has no replicas)
+            if shards.enabled:
+                shard_engine = shards.engine_for(mapper, clause)
+                if shard_engine is not None:
+                    return shard_engine
+
+            if not writing and has_request_context() and g.get("replica") is not None:
+                return g.replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+### Mark a view as read-only -- optionally only for some methods, e.g. @read_only("GET") ###
+def read_only(*methods):
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not methods or request.method in methods:
+                g.replica = replicas.choose()
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+replicas = ReplicaSet()
@@ -0,0 +1,107 @@
+### Shard habits and activity logs across several databases by user ###
+# Users and followers stay on the primary database, which acts as the directory: user.shard records which
+# database holds a user's habits and logs. Each request works against the shard of the user whose habits it
+# reads or writes (the logged-in user, or the friend on /profile). Reads that need several users' habits go
+# to every shard in parallel and merge the rows (scatter-gather).
+# With no HABIT_SHARD_URIS configured everything stays on the primary database.
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import create_engine, MetaData, Table
+from sqlalchemy.sql.util import find_tables
+
+# Tables whose rows live on a user's shard
+SHARDED_TABLES = {"habit", "activity_log", "activity_bitmap", "activity_rollup", "activity_log_archive"}
+
+current_shard = ContextVar("current_shard", default=None)
+
+
+class ShardingError(Exception):
+    pass
+
+
+class ShardRouter:
+    def __init__(self, app=None):
+        self.engines = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("HABIT_SHARD_URIS", [])
+        self.configure(app.config["HABIT_SHARD_URIS"])
+
+    def configure(self, uris):
+        for engine in self.engines:
+            engine.dispose()
+        self.engines = [create_engine(uri) for uri in uris]
+
+    @property
+    def enabled(self):
+        return len(self.engines) > 0
+
+    # Shard for a user: where they were placed, or where new users with this id go
+    def shard_for(self, user_id, stored_shard=None):
+        if stored_shard is not None:
+            return stored_shard
+        return user_id % len(self.engines)
+
+    # Work against one shard for the rest of the request (or until reset)
+    def use(self, shard):
+        return current_shard.set(shard)
+
+    @contextmanager
+    def using(self, shard):
+        token = current_shard.set(shard)
+        try:
+            yield
+        finally:
+            current_shard.reset(token)
+
+    # Engine for a statement, or None if it only touches primary tables
+    def engine_for(self, mapper, clause):
+        tables = set()
+        if mapper is not None:
+            tables.update(table.name for table in mapper.tables)
+        if clause is not None:
+            # Subqueries and aliases are found too -- only the tables underneath them matter
+            tables.update(table.name for table in find_tables(clause, include_joins=True, include_aliases=True)
+                          if isinstance(table, Table))
+            if getattr(clause, "table", None) is not None:
+                tables.add(clause.table.name)
+
+        if not tables & SHARDED_TABLES:
+            return None
+        if tables - SHARDED_TABLES:
+            raise ShardingError("Query joins sharded and unsharded tables: {0}".format(", ".join(sorted(tables))))
+        shard = current_shard.get()
+        if shard is None:
+            raise ShardingError("No shard selected for a query on {0}".format(", ".join(sorted(tables))))
+        return self.engines[shard]
+
+    ### Run a Core statement on every shard in parallel and return all rows ###
+    def scatter(self, statement):
+        def run(engine):
+            with engine.connect() as connection:
+                return connection.execute(statement).all()
+
+        with ThreadPoolExecutor(max_workers=len(self.engines)) as pool:
+            return [row for rows in pool.map(run, self.engines) for row in rows]
+
+    ### Create the sharded tables on every shard ###
+    # Foreign keys to primary tables (habit.user_id -> user.id) cannot cross databases, so they are left out
+    def create_all(self, metadata):
+        shard_metadata = MetaData()
+        for name in SHARDED_TABLES:
+            table = metadata.tables[name].to_metadata(shard_metadata)
+            for constraint in list(table.foreign_key_constraints):
+                if constraint.elements[0].target_fullname.split(".")[0] not in SHARDED_TABLES:
+                    table.constraints.discard(constraint)
+                    for foreign_key in constraint.elements:
+                        foreign_key.parent.foreign_keys.discard(foreign_key)
+                        table.foreign_keys.discard(foreign_key)
+        for engine in self.engines:
+            shard_metadata.create_all(engine)
+
+
+shards = ShardRouter()
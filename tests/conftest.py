@@ -4,7 +4,8 @@ import pytest
 # Set flag BEFORE importing app
 os.environ['FLASK_ENV'] = 'TESTING'
 
-from app import app, db
+from app import app, db, username_index, cache, limiter
+from sqlalchemy import event
 
 # Create and destroy temporary database for tests
 @pytest.fixture()
@@ -13,6 +14,9 @@ def client():
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///:memory:"
     with app.app_context():
         db.create_all()
+        username_index.invalidate()
+        cache.clear()
+        limiter.reset()
         yield app.test_client()
         db.session.remove()
         db.drop_all()
@@ -31,4 +35,20 @@ class AuthActions:
 # Use helper class for login
 @pytest.fixture()
 def auth(client):
-    return AuthActions(client)
\ No newline at end of file
+    return AuthActions(client)
+
+# Make a request and return its response with every statement sent to the database meanwhile
+@pytest.fixture()
+def count_queries():
+    def count(make_request):
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = make_request()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return response, statements
+    return count
@@ -0,0 +1,83 @@
+from app import app, db, Habit, ActivityLog
+from datetime import date, timedelta
+
+
+# Create habits for the logged-in user and return their ids
+def add_habits(client, names):
+    for name in names:
+        client.post('/', data={'new_habit': name})
+    return [Habit.query.filter_by(name= name).first().id for name in names]
+
+
+### Test the API answers 401 in JSON rather than redirecting to the login page ###
+def test_api_requires_login(client):
+    response = client.get('/api/v1/habits')
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'Log in first'}
+
+
+### Test habits are paged by id and only the fields asked for are returned ###
+def test_api_habits(client, auth):
+    auth.login('tester', '12345678')
+    gym_id, read_id, walk_id = add_habits(client, ['gym', 'read', 'walk'])
+    client.post(f'/done/{gym_id}')
+
+    first_page = client.get('/api/v1/habits?limit=2').get_json()
+    assert first_page['data'][0] == {'id': gym_id, 'name': 'gym', 'streak': 1, 'last_done': date.today().isoformat(),
+                                     'date_created': date.today().isoformat()}
+    assert first_page['next'] == read_id
+    second_page = client.get(f'/api/v1/habits?limit=2&after={read_id}&fields=name').get_json()
+    assert second_page == {'data': [{'name': 'walk'}], 'next': None}
+
+    response = client.get('/api/v1/habits?fields=name,password')
+    assert response.status_code == 400
+    assert 'password' in response.get_json()['error']
+
+
+### Test a habit's logs are paged by log id with one bounded query ###
+def test_api_logs(client, auth, count_queries):
+    auth.login('tester', '12345678')
+    habit_id, = add_habits(client, ['gym'])
+    db.session.add_all([ActivityLog(habit_id= habit_id, date= date.today() - timedelta(days= days))
+                        for days in range(300)])
+    db.session.commit()
+    log_ids = [log.id for log in ActivityLog.query.order_by(ActivityLog.id).all()]
+
+    path = f'/api/v1/habits/{habit_id}/logs?after={log_ids[49]}&limit=1000&fields=date'
+    page, statements = count_queries(lambda: client.get(path).get_json())
+    assert len(page['data']) == app.config['API_MAX_PAGE_SIZE']
+    assert page['data'][0] == {'date': (date.today() - timedelta(days= 50)).isoformat()}
+    assert page['next'] == log_ids[249]
+    # The page starts from the cursor rather than skipping rows
+    assert 'activity_log.id > ?' in statements[-1]
+
+    last_page = client.get(f'/api/v1/habits/{habit_id}/logs?after={page["next"]}').get_json()
+    assert len(last_page['data']) == 50
+    assert last_page['next'] is None
+
+    stats = client.get(f'/api/v1/habits/{habit_id}/stats').get_json()
+    assert stats['count'] == 300
+    assert sum(stats['daily_stats']) == 300
+
+
+### Test other users' habits are only shown to their followers ###
+def test_api_friends(client, auth):
+    for name in ['bill', 'Anna']:
+        auth.login(name, '12345678')
+        add_habits(client, [f'{name}_habit'])
+        client.get('/logout')
+    auth.login('tester', '12345678')
+    bill_habit_id = Habit.query.filter_by(name= 'bill_habit').first().id
+
+    assert client.get('/api/v1/users/bill/habits').status_code == 403
+    assert client.get(f'/api/v1/habits/{bill_habit_id}/logs').status_code == 404
+    assert client.get(f'/api/v1/habits/{bill_habit_id}/stats').status_code == 404
+    assert client.get('/api/v1/users/nobody/habits').status_code == 404
+
+    client.post('/follow/bill')
+    client.post('/follow/Anna')
+    assert client.get('/api/v1/users/bill/habits?fields=name').get_json() == {'data': [{'name': 'bill_habit'}],
+                                                                              'next': None}
+    first_page = client.get('/api/v1/friends?limit=1&fields=username').get_json()
+    assert first_page == {'data': [{'username': 'Anna'}], 'next': 'anna'}
+    assert client.get('/api/v1/friends?after=anna&fields=username').get_json()['data'] == [{'username': 'bill'}]
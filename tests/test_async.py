@@ -0,0 +1,87 @@
+from app import app, db, User, Habit, ActivityLog, followers, use_async_views
+from async_db import async_db, async_url
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from datetime import date, timedelta
+import pytest
+
+
+# Serve home, stats and profile from the async views, reading a database file that holds different data
+# from the (in-memory) primary, so pages show which engine they came from
+@pytest.fixture()
+def async_client(client, tmp_path):
+    uri = f"sqlite:///{tmp_path / 'async.db'}"
+    engine = create_engine(uri)
+    db.metadata.create_all(engine)
+    with Session(engine) as seed_session:
+        seed_session.add_all([User(id= 1, username= 'tester', password= '12345678'),
+                              User(id= 2, username= 'bill', password= '12345678')])
+        seed_session.add_all([Habit(id= 1, name= 'async_gym', user_id= 1, date_created= date.today() - timedelta(days=3)),
+                              Habit(id= 2, name= 'bills_habit', user_id= 2, date_created= date.today())])
+        seed_session.add(ActivityLog(habit_id= 1, date= date.today()))
+        seed_session.flush()
+        seed_session.execute(insert(followers).values(follower_id= 1, followed_id= 2))
+        seed_session.commit()
+    engine.dispose()
+
+    views = dict(app.view_functions)
+    async_db.configure(async_url(uri))
+    use_async_views()
+    db.session.add(User(id= 1, username= 'tester', password= '12345678'))
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    yield client
+    app.view_functions.update(views)
+    async_db.configure(None)
+
+
+### Test database URLs are switched to their async drivers ###
+def test_async_url():
+    assert async_url("postgresql://postgres:pw@127.0.0.1/habittracker").drivername == "postgresql+asyncpg"
+    assert str(async_url("sqlite:///habits.db")) == "sqlite+aiosqlite:///habits.db"
+    with pytest.raises(ValueError):
+        async_url("mysql://localhost/habittracker")
+
+
+### Test home lists habits and friends loaded through the async engine ###
+def test_async_home(async_client):
+    response = async_client.get('/')
+    assert response.status_code == 200
+    assert b'async_gym' in response.data
+    assert b'bill' in response.data
+
+
+### Test adding a habit still goes through the sync view to the primary ###
+def test_async_home_post(async_client):
+    async_client.post('/', data={'new_habit': 'from_primary'})
+    assert Habit.query.filter_by(name= 'from_primary').count() == 1
+
+
+### Test stats are counted on the async engine and unchanged pages answer 304 ###
+def test_async_stats(async_client):
+    response = async_client.get('/stats/1')
+    assert b'Total count: 1' in response.data
+
+    response = async_client.get('/stats/1', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+    # Habits owned by someone else send the user home
+    assert async_client.get('/stats/2').status_code == 302
+
+
+### Test profile checks the follow and shows the friend's habits ###
+def test_async_profile(async_client):
+    response = async_client.get('/profile/bill')
+    assert b'bills_habit' in response.data
+
+    assert async_client.get('/profile/nobody').status_code == 302
+
+
+### Test logged out users are sent to register ###
+def test_async_login_required(async_client):
+    with async_client.session_transaction() as sess:
+        sess.pop('user_id')
+    response = async_client.get('/')
+    assert response.status_code == 302
+    assert '/register' in response.headers['Location']
@@ -1,4 +1,7 @@
-from app import User, db, app
+from app import User, Habit, ActivityLog, followers, db, app
+from datetime import date
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
 import pytest
 
 ### Test basic User registration ###
@@ -118,4 +121,54 @@ def test_unauthorized_access(client):
 @pytest.mark.parametrize('route', ['/profile/tester', 'search', '/follow/tester', '/unfollow/tester'])
 def test_unauthorized_access(client, route):
     response= client.post(route, follow_redirects= True)
-    assert b'Create An Account To Get Started!' in response.data
\ No newline at end of file
+    assert b'Create An Account To Get Started!' in response.data
+
+### Test login lookup uses the lower(username) index instead of scanning the user table ###
+def test_username_lookup_uses_index(client):
+    query = User.query.filter(func.lower(User.username) == 'tester')
+    plan = db.session.execute(text('EXPLAIN QUERY PLAN ' + str(query.statement.compile(compile_kwargs={'literal_binds': True})))).all()
+    assert 'ix_user_username_lower' in str(plan)
+
+
+### Test two usernames differing only in case cannot both be stored ###
+def test_username_unique_ignores_case(client):
+    db.session.add(User(username= 'Tester', password= '12345678'))
+    db.session.commit()
+    db.session.add(User(username= 'tester', password= '12345678'))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+
+
+### Test deleting an account removes the user's habits, logs and follower connections ###
+def test_delete_account(client, auth):
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+
+    with app.app_context():
+        tester = User.query.filter_by(username= 'tester').first()
+        bill = User(username= 'bill', password= '12345678')
+        db.session.add(bill)
+        tester.followed.append(bill)
+        bill.followed.append(tester)
+        db.session.commit()
+        bill_habit = Habit(name= 'read', user_id= bill.id, date_created= date.today())
+        db.session.add(bill_habit)
+        db.session.commit()
+        habit = Habit.query.filter_by(name= 'gym').first()
+        habit_id = habit.id
+
+    client.post(f'/done/{habit_id}')
+    response = client.post('/account/delete', follow_redirects= True)
+    assert b'Your account has been deleted' in response.data
+
+    with app.app_context():
+        assert User.query.filter_by(username= 'tester').first() is None
+        assert Habit.query.filter_by(name= 'gym').first() is None
+        assert ActivityLog.query.count() == 0
+        assert db.session.query(followers).count() == 0
+        # Other users keep their data
+        assert Habit.query.filter_by(name= 'read').count() == 1
+
+    # Session is cleared
+    response = client.get('/', follow_redirects= True)
+    assert b'Create An Account To Get Started!' in response.data
@@ -0,0 +1,27 @@
+from app import User, Habit, ActivityLog
+from benchmarks.seed import seed, SCALES
+from benchmarks.run import run, compare
+from benchmarks import hashing as hashing_benchmark
+
+
+### Test the benchmark seeds data and measures every route ###
+def test_benchmark_smoke(client):
+    seed(**SCALES['tiny'], log= lambda message: None)
+    assert User.query.count() == 20
+    assert Habit.query.count() == 60
+    assert ActivityLog.query.count() > 0
+
+    results = run(iterations= 3, sample_users= 5)
+    assert set(results) == {'home', 'stats', 'profile', 'search', 'mark_done', 'login', 'follow'}
+    assert results['home']['queries'] == 2
+
+    # A route using more queries than the baseline is a regression
+    baseline = {'routes': {'home': dict(results['home'], queries= 1)}}
+    assert compare(results, baseline) == ['home: 2 queries per request, baseline is 1']
+
+
+### Test the hashing benchmark reports a rate for each pool size ###
+def test_hashing_benchmark_smoke():
+    results = hashing_benchmark.run([1], logins= 4, method= 'pbkdf2:sha256:1000')
+    assert list(results) == [1]
+    assert results[1] > 0
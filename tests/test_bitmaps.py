@@ -0,0 +1,153 @@
+from app import app, db, User, Habit, ActivityLog, ActivityBitmap, habit_stats, reconcile_streaks, set_completion_bit
+from migrations import backfill_activity_bitmaps
+from bitmaps import day_position, weekday_counts, streak_and_last_done, completed_days, WORD_COLUMNS
+from datetime import date, timedelta
+import logging
+import random
+import pytest
+
+
+# Read and write completions with the given storage for one test
+@pytest.fixture()
+def storage(client):
+    def use(name):
+        app.config['ACTIVITY_STORAGE'] = name
+    yield use
+    app.config['ACTIVITY_STORAGE'] = 'log'
+
+
+# A habit owned by a new user, created days_old days ago
+def make_habit(days_old=400):
+    tester = User(username= 'tester', password= '12345678')
+    db.session.add(tester)
+    db.session.commit()
+    habit = Habit(name= 'gym', user_id= tester.id, date_created= date.today() - timedelta(days= days_old))
+    db.session.add(habit)
+    db.session.commit()
+    return tester, habit
+
+
+# A bitmap row as (year, word0 ... word5)
+def bitmap_rows(habit_id):
+    return [(row.year, *[getattr(row, column) for column in WORD_COLUMNS])
+            for row in ActivityBitmap.query.filter_by(habit_id= habit_id).order_by(ActivityBitmap.year)]
+
+
+### Test popcounts and bit scans agree with counting dates one by one ###
+def test_bitmap_maths():
+    rng = random.Random(0)
+    days = sorted({date(2023, 1, 1) + timedelta(days= rng.randrange(3 * 366)) for _ in range(500)})
+    years = {}
+    for day in days:
+        year, column, mask = day_position(day)
+        words = years.setdefault(year, [0] * 6)
+        words[WORD_COLUMNS.index(column)] |= mask
+    rows = [(year, *words) for year, words in sorted(years.items())]
+
+    assert [day for year, *words in rows for day in completed_days(year, words)] == days
+    expected = [0] * 7
+    for day in days:
+        expected[day.weekday()] += 1
+    assert weekday_counts(rows) == expected
+    # Dec 31 of a leap year is bit 365, the last bit of the last word
+    assert day_position(date(2024, 12, 31)) == (2024, 'word5', 1 << 60)
+
+
+### Test streaks carry across the new year ###
+def test_streak_across_years():
+    days = [date(2023, 12, 30), date(2023, 12, 31), date(2024, 1, 1), date(2024, 1, 2)]
+    years = {}
+    for day in days:
+        years[day.year] = years.get(day.year, 0) | (1 << (day.timetuple().tm_yday - 1))
+    assert streak_and_last_done(years) == (4, date(2024, 1, 2))
+
+    years[2023] &= ~(1 << 363)
+    assert streak_and_last_done(years) == (3, date(2024, 1, 2))
+    assert streak_and_last_done({}) == (0, None)
+
+
+### Test completing a habit with bitmap storage sets a bit instead of adding a log row ###
+def test_mark_done_sets_bit(client, auth, storage):
+    storage('bitmap')
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    habit = Habit.query.filter_by(name= 'gym').first()
+
+    client.post(f'/done/{habit.id}')
+    client.post(f'/done/{habit.id}')
+    assert ActivityLog.query.count() == 0
+    rows = bitmap_rows(habit.id)
+    assert [day for year, *words in rows for day in completed_days(year, words)] == [date.today()]
+
+    response = client.get(f'/stats/{habit.id}')
+    assert b'Total count: 1' in response.data
+
+
+### Test stats from bitmaps match stats from logs over a long history ###
+def test_stats_from_bitmaps(client, storage):
+    tester, habit = make_habit()
+    for days_ago in range(0, 400, 3):
+        db.session.add(ActivityLog(habit_id= habit.id, date= date.today() - timedelta(days= days_ago)))
+        set_completion_bit(db.session, habit.id, date.today() - timedelta(days= days_ago))
+    db.session.commit()
+
+    from_logs = habit_stats(habit)
+    storage('bitmap')
+    assert habit_stats(habit) == from_logs
+    assert len(bitmap_rows(habit.id)) <= 2
+
+
+### Test the dual-write period writes both and logs stats that disagree ###
+def test_dual_storage(client, auth, storage, caplog):
+    storage('dual')
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    habit = Habit.query.filter_by(name= 'gym').first()
+    client.post(f'/done/{habit.id}')
+    assert ActivityLog.query.count() == 1
+    assert len(bitmap_rows(habit.id)) == 1
+
+    with caplog.at_level(logging.WARNING, logger= 'habittracker.activity_storage'):
+        habit_stats(habit)
+        assert caplog.records == []
+
+        # A log written without its bit (e.g. before the backfill) shows up as a difference
+        db.session.add(ActivityLog(habit_id= habit.id, date= date.today() - timedelta(days= 1)))
+        db.session.commit()
+        count, completion_rate, stats_by_day = habit_stats(habit)
+    assert count == 2
+    assert len(caplog.records) == 1
+
+
+### Test the backfill builds bitmaps from existing logs and can be run again ###
+def test_backfill_bitmaps(client, storage):
+    tester, habit = make_habit()
+    for days_ago in [0, 1, 2, 200, 399]:
+        db.session.add(ActivityLog(habit_id= habit.id, date= date.today() - timedelta(days= days_ago)))
+    db.session.commit()
+    # A completion already written during the dual-write period
+    set_completion_bit(db.session, habit.id, date.today())
+    db.session.commit()
+
+    backfill_activity_bitmaps(db.engine, chunk_size= 1, log= lambda message: None)
+    backfill_activity_bitmaps(db.engine, chunk_size= 1, log= lambda message: None)
+    days = [day for year, *words in bitmap_rows(habit.id) for day in completed_days(year, words)]
+    assert days == sorted(date.today() - timedelta(days= days_ago) for days_ago in [0, 1, 2, 200, 399])
+
+    # Streaks rebuilt from the bitmaps
+    storage('bitmap')
+    assert reconcile_streaks(db.session) == 1
+    db.session.expire_all()
+    assert (habit.streak, habit.last_done) == (3, date.today())
+
+
+### Test deleting a habit deletes its bitmaps ###
+def test_delete_habit_removes_bitmaps(client, auth, storage):
+    storage('bitmap')
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    habit_id = Habit.query.filter_by(name= 'gym').first().id
+    client.post(f'/done/{habit_id}')
+
+    client.post(f'/delete/{habit_id}')
+    assert ActivityBitmap.query.count() == 0
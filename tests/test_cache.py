@@ -0,0 +1,135 @@
+from app import app, db, User, Habit, cache, home_habits_key, friends_fragment_key
+from cache import LRUCache, SQLiteCache, create_cache
+from datetime import date
+import pytest
+
+
+### Test LRU drops the least recently used entry and expired entries ###
+def test_lru_cache():
+    lru = LRUCache(max_entries= 2, ttl= 60)
+    lru.set('a', '1')
+    lru.set('b', '2')
+    assert lru.get('a') == '1'
+    lru.set('c', '3')
+    # 'b' was used least recently
+    assert lru.get('b') is None
+    assert lru.get('a') == '1'
+    assert lru.get('c') == '3'
+    assert (lru.hits, lru.misses) == (3, 1)
+
+    expired = LRUCache(ttl= 0)
+    expired.set('a', '1')
+    assert expired.get('a') is None
+
+
+### Test the shared SQLite backend is visible to a second cache (another worker) on the same file ###
+def test_sqlite_cache(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    worker_one = SQLiteCache(path, ttl= 60)
+    worker_two = SQLiteCache(path, ttl= 60)
+
+    worker_one.set('home_habits:1', '<ul></ul>')
+    assert worker_two.get('home_habits:1') == '<ul></ul>'
+    worker_two.delete('home_habits:1', 'friends:1')
+    assert worker_one.get('home_habits:1') is None
+
+
+### Test unknown backends are rejected ###
+def test_unknown_backend():
+    assert create_cache({'CACHE_BACKEND': 'none'}).get('a') is None
+    with pytest.raises(ValueError):
+        create_cache({'CACHE_BACKEND': 'redis'})
+
+
+### Test home page is served from the cache and refreshed by each write route ###
+def test_home_cache_invalidation(client, auth, count_queries):
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+
+    response, statements = count_queries(lambda: client.get('/'))
+    assert b'gym' in response.data
+    # Both lists cached -- only the user lookup is left
+    response, statements = count_queries(lambda: client.get('/'))
+    assert len(statements) == 1
+    assert b'Completed Today!' not in response.data
+
+    with app.app_context():
+        habit_id = Habit.query.filter_by(name= 'gym').first().id
+        db.session.add(User(username= 'bill', password= '12345678'))
+        db.session.commit()
+
+    # Completing, following, unfollowing, adding and deleting all show up straight away
+    client.post(f'/done/{habit_id}')
+    assert b'Completed Today!' in client.get('/').data
+    client.post('/follow/bill')
+    assert b'/profile/bill' in client.get('/').data
+    client.post('/unfollow/bill')
+    assert b'/profile/bill' not in client.get('/').data
+    client.post('/', data={'new_habit': 'read'})
+    assert b'read' in client.get('/').data
+    client.post(f'/delete/{habit_id}')
+    assert b'gym' not in client.get('/').data
+
+
+### Test friends profile is cached and refreshed when the friend completes a habit ###
+def test_profile_cache_invalidation(client, auth):
+    auth.login('bill', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    client.get('/logout')
+    auth.login('tester', '12345678')
+    client.post('/follow/bill')
+
+    assert b'Completed Today!' not in client.get('/profile/bill').data
+    with app.app_context():
+        habit_id = Habit.query.filter_by(name= 'gym').first().id
+
+    # Bill completes his habit
+    client.get('/logout')
+    client.post('/login', data={'username': 'bill', 'password': '12345678'})
+    client.post(f'/done/{habit_id}')
+    client.get('/logout')
+    client.post('/login', data={'username': 'tester', 'password': '12345678'})
+
+    assert b'Completed Today!' in client.get('/profile/bill').data
+
+
+### Test a habit list rendered before a change committed is never served with the new version ###
+def test_profile_cache_keyed_by_version(client, auth):
+    auth.login('bill', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    client.get('/logout')
+    auth.login('tester', '12345678')
+    client.post('/follow/bill')
+    assert b'Completed Today!' not in client.get('/profile/bill').data
+
+    # Bill's change commits but the old list stays cached, as when a slow reader stores it after the delete
+    bill = User.query.filter_by(username= 'bill').first()
+    db.session.execute(Habit.__table__.update().values(last_done= date.today(), streak= 1))
+    bill.version += 1
+    db.session.commit()
+
+    response = client.get('/profile/bill')
+    assert response.headers['ETag'] == f'"profile-{bill.id}-{bill.version}-{date.today().isoformat()}"'
+    assert b'Completed Today!' in response.data
+
+
+### Test home lists rendered before a write committed are never served after it ###
+def test_home_cache_keyed_by_version(client, auth):
+    auth.login('tester', '12345678')
+    client.get('/')
+    with app.app_context():
+        db.session.add(User(username= 'bill', password= '12345678'))
+        db.session.commit()
+    tester = User.query.filter_by(username= 'tester').first()
+    old_version = tester.version
+
+    # A slow reader stores the old lists after the follow deleted them
+    client.post('/follow/bill')
+    client.post('/', data={'new_habit': 'gym'})
+    cache.set(home_habits_key(tester.id, old_version, date.today()), 'stale habits')
+    cache.set(friends_fragment_key(tester.id, old_version), 'stale friends')
+
+    response = client.get('/')
+    assert b'stale' not in response.data
+    assert b'gym' in response.data
+    assert b'/profile/bill' in response.data
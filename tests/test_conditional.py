@@ -0,0 +1,88 @@
+from app import app, db, User, Habit
+from datetime import date
+
+
+### Test stats page answers 304 for an unchanged habit without counting logs ###
+def test_stats_not_modified(client, auth, count_queries):
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    with app.app_context():
+        habit_id = Habit.query.filter_by(name= 'gym').first().id
+
+    response = client.get(f'/stats/{habit_id}')
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert response.headers['Cache-Control'] in ('private, no-cache', 'no-cache, private')
+
+    response, statements = count_queries(lambda: client.get(f'/stats/{habit_id}', headers={'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.data == b''
+    # Only the habit row was read
+    assert len(statements) == 1
+    assert 'activity_log' not in statements[0]
+
+    # Last-Modified works too
+    response = client.get(f'/stats/{habit_id}', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+    # Logging the habit changes the version
+    client.post(f'/done/{habit_id}')
+    response = client.get(f'/stats/{habit_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert b'Total count: 1' in response.data
+
+    # A page with a flashed message waiting is rendered, so the message shows here and not on a later page
+    etag = response.headers['ETag']
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('message', 'Habit saved')]
+    response = client.get(f'/stats/{habit_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Habit saved' in response.data
+    assert client.get(f'/stats/{habit_id}', headers={'If-None-Match': etag}).status_code == 304
+
+
+### Test friends profile answers 304 until the friend adds, logs or deletes a habit ###
+def test_profile_not_modified(client, auth, count_queries):
+    auth.login('tester', '12345678')
+    with app.app_context():
+        bill = User(username= 'bill', password= '12345678')
+        db.session.add(bill)
+        db.session.commit()
+        habit = Habit(name= 'gym', user_id= bill.id, date_created= date.today())
+        db.session.add(habit)
+        db.session.commit()
+        bill_id, habit_id = bill.id, habit.id
+    client.post('/follow/bill')
+
+    etag = client.get('/profile/bill').headers['ETag']
+    response, statements = count_queries(lambda: client.get('/profile/bill', headers={'If-None-Match': etag}))
+    assert response.status_code == 304
+    # Friend lookup and follow check only -- no habit query
+    assert len(statements) == 2
+    assert not any('FROM habit' in statement for statement in statements)
+
+    # Bill logs his habit
+    with client.session_transaction() as sess:
+        sess['user_id'] = bill_id
+    client.post(f'/done/{habit_id}')
+    with client.session_transaction() as sess:
+        sess['user_id'] = User.query.filter_by(username= 'tester').first().id
+
+    response = client.get('/profile/bill', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Completed Today!' in response.data
+
+
+### Test users who stop following lose access even with a cached page ###
+def test_profile_not_modified_requires_follow(client, auth):
+    auth.login('tester', '12345678')
+    with app.app_context():
+        db.session.add(User(username= 'bill', password= '12345678'))
+        db.session.commit()
+    client.post('/follow/bill')
+    etag = client.get('/profile/bill').headers['ETag']
+
+    client.post('/unfollow/bill')
+    response = client.get('/profile/bill', headers={'If-None-Match': etag}, follow_redirects= True)
+    assert b'Follow bill to see their habits' in response.data
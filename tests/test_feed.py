@@ -0,0 +1,108 @@
+from app import app, User, Habit, FeedEvent, FeedItem
+import pytest
+
+
+# Register users and make each of them follow 'bill'
+def follow_bill(client, auth, usernames):
+    auth.login('bill', '12345678')
+    client.get('/logout')
+    for username in usernames:
+        auth.login(username, '12345678')
+        client.post('/follow/bill')
+        client.get('/logout')
+    client.post('/login', data={'username': 'bill', 'password': '12345678'})
+
+
+# Restore the feed settings a test changes
+@pytest.fixture()
+def feed_config():
+    saved = {key: app.config[key] for key in ["FEED_FANOUT_LIMIT", "FEED_PAGE_SIZE"]}
+    yield
+    app.config.update(saved)
+
+
+### Test creating and completing habits pushes events to each follower's feed ###
+def test_events_fan_out_to_followers(client, auth):
+    follow_bill(client, auth, ['tester', 'anna'])
+    client.post('/', data={'new_habit': 'gym'})
+    client.post(f'/done/{Habit.query.filter_by(name= "gym").first().id}')
+    client.get('/logout')
+
+    assert FeedEvent.query.count() == 2
+    assert FeedItem.query.count() == 4
+    auth.login('tester', '12345678')
+    response = client.get('/feed')
+    assert response.data.index(b'completed gym') < response.data.index(b'started gym')
+
+
+### Test accounts over the fan-out limit are read from instead of pushed to every follower ###
+def test_celebrity_events_are_pulled(client, auth, feed_config):
+    app.config["FEED_FANOUT_LIMIT"] = 1
+    follow_bill(client, auth, ['tester', 'anna'])
+    client.post('/', data={'new_habit': 'gym'})
+    client.get('/logout')
+
+    # Flagged by the second follow, so no event is pushed
+    assert User.query.filter_by(username= 'bill').first().celebrity
+    assert FeedItem.query.count() == 0
+    auth.login('tester', '12345678')
+    assert b'started gym' in client.get('/feed').data
+
+    # Still pulled once the account is back under the limit, and gone once unfollowed
+    app.config["FEED_FANOUT_LIMIT"] = 1000
+    client.post('/unfollow/bill')
+    assert b'started gym' not in client.get('/feed').data
+
+
+### Test pages are keyed on the last event shown, mixing pushed and pulled events ###
+def test_feed_pages(client, auth, feed_config, count_queries):
+    app.config["FEED_PAGE_SIZE"] = 3
+    auth.login('anna', '12345678')
+    client.get('/logout')
+    follow_bill(client, auth, ['tester', 'sam'])
+    for name in ['a1', 'a2', 'a3']:
+        client.post('/', data={'new_habit': name})
+    client.get('/logout')
+    # Anna becomes a celebrity when sam follows her, before her events
+    app.config["FEED_FANOUT_LIMIT"] = 0
+    auth.login('sam', '12345678')
+    client.post('/follow/anna')
+    client.get('/logout')
+    auth.login('anna', '12345678')
+    for name in ['b1', 'b2']:
+        client.post('/', data={'new_habit': name})
+    client.get('/logout')
+
+    auth.login('tester', '12345678')
+    client.post('/follow/anna')
+    first_page, statements = count_queries(lambda: client.get('/feed').data)
+    assert b'b2' in first_page and b'b1' in first_page and b'a3' in first_page
+    assert b'a2' not in first_page
+    # One query for pushed events, one for pulled events
+    assert len(statements) == 2
+
+    next_before = FeedEvent.query.filter_by(habit_name= 'a3').first().id
+    assert f'before={next_before}'.encode() in first_page
+    second_page = client.get(f'/feed?before={next_before}').data
+    assert b'a2' in second_page and b'a1' in second_page and b'a3' not in second_page
+    assert b'Older' not in second_page
+
+
+### Test following copies recent events and unfollowing or deleting an account removes them ###
+def test_follow_unfollow_and_delete(client, auth):
+    auth.login('bill', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    client.get('/logout')
+
+    auth.login('tester', '12345678')
+    client.post('/follow/bill')
+    assert b'started gym' in client.get('/feed').data
+    client.post('/unfollow/bill')
+    assert FeedItem.query.count() == 0
+    client.post('/follow/bill')
+    client.get('/logout')
+
+    client.post('/login', data={'username': 'bill', 'password': '12345678'})
+    client.post('/account/delete')
+    assert FeedEvent.query.count() == 0
+    assert FeedItem.query.count() == 0
@@ -0,0 +1,71 @@
+from app import app, db, User, Habit, followers
+from sqlalchemy import insert
+from datetime import date, timedelta
+
+
+# Add `count` friends for the user, each with two habits (one completed today), straight into the database
+def add_friends(user_id, count):
+    db.session.execute(insert(User), [{'username': f'friend{number:03}', 'password': 'x'} for number in range(count)])
+    friend_ids = [user.id for user in User.query.filter(User.username.like('friend%')).all()]
+    db.session.execute(insert(followers), [{'follower_id': user_id, 'followed_id': friend_id}
+                                           for friend_id in friend_ids])
+    db.session.execute(insert(Habit), [{'name': name, 'user_id': friend_id, 'streak': 2, 'last_done': last_done,
+                                        'date_created': date.today()}
+                                       for friend_id in friend_ids
+                                       for name, last_done in [('gym', date.today()),
+                                                               ('read', date.today() - timedelta(days= 5))]])
+    db.session.commit()
+
+
+# Statements run while loading one dashboard page
+def dashboard_statements(client, count_queries, path='/friends'):
+    db.session.remove()
+    return count_queries(lambda: client.get(path))
+
+
+### Test the dashboard costs one query whether the user follows 1 friend or 500 ###
+def test_dashboard_query_count(client, auth, count_queries):
+    auth.login('tester', '12345678')
+    tester_id = User.query.filter_by(username= 'tester').first().id
+    add_friends(tester_id, 1)
+    response, statements = dashboard_statements(client, count_queries)
+    assert b'friend000' in response.data
+    assert b'gym (2 day streak)' in response.data
+    assert b'read (0 day streak)' in response.data
+    assert len(statements) == 1
+
+    db.session.execute(followers.delete())
+    db.session.execute(Habit.__table__.delete())
+    db.session.execute(User.__table__.delete().where(User.id != tester_id))
+    db.session.commit()
+    add_friends(tester_id, 500)
+    response, statements = dashboard_statements(client, count_queries)
+    assert len(statements) == 1
+    # Only the columns the page shows, never password hashes
+    assert 'password' not in statements[0]
+    assert response.data.count(b'Completed Today!') == app.config["FRIENDS_PAGE_SIZE"]
+
+
+### Test pages are keyed on the last username shown ###
+def test_dashboard_pages(client, auth):
+    auth.login('tester', '12345678')
+    add_friends(User.query.filter_by(username= 'tester').first().id, 45)
+
+    first_page = client.get('/friends').data
+    assert b'friend000' in first_page and b'friend019' in first_page
+    assert b'friend020' not in first_page
+    assert b'after=friend019' in first_page
+
+    last_page = client.get('/friends?after=friend039').data
+    assert b'friend040' in last_page and b'friend044' in last_page
+    assert b'friend039' not in last_page
+    assert b'Next page' not in last_page
+
+
+### Test friends without habits are listed too ###
+def test_dashboard_friend_without_habits(client, auth):
+    auth.login('bill', '12345678')
+    client.get('/logout')
+    auth.login('tester', '12345678')
+    client.post('/follow/bill')
+    assert b'bill' in client.get('/friends').data
@@ -1,4 +1,8 @@
-from app import Habit, app, User, db, ActivityLog
+from app import Habit, app, User, db, ActivityLog, habit_stats, complete_habit, reconcile_streaks
+import pytest
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 from datetime import date, timedelta
 
 
@@ -135,6 +139,8 @@ def test_repeat_habit_completion(auth, client):
     with app.app_context():
         habit =  Habit.query.filter_by(name= 'gym').first()
         assert habit.streak == 1
+        # Only one log is stored for the day
+        assert ActivityLog.query.filter_by(habit_id= habit_id).count() == 1
 
 
 ### Test streak reset logic ###
@@ -309,3 +315,177 @@ def test_habit_date_creation(client, auth):
         assert habit.date_created == date.today()
 
 
+
+### Test grouped stats query matches counting every log in Python ###
+def test_stats_match_python_loop(client, auth):
+    # Log in tester
+    auth.login('tester', '12345678')
+
+    today = date.today()
+    with app.app_context():
+        tester = User.query.filter_by(username= 'tester').first()
+        test_habit = Habit(name= 'gym', user_id= tester.id, date_created= today - timedelta(days= 60))
+        db.session.add(test_habit)
+        db.session.commit()
+
+        # Log the habit on an uneven spread of days (skip every third day)
+        for days_ago in range(61):
+            if days_ago % 3 != 1:
+                db.session.add(ActivityLog(habit_id= test_habit.id, date= today - timedelta(days= days_ago)))
+        db.session.commit()
+
+        # Count stats the old way -- one log at a time
+        expected_by_day = {0:0, 1:0, 2:0, 3:0, 4:0, 5:0, 6:0}
+        for log in ActivityLog.query.filter_by(habit_id= test_habit.id).all():
+            expected_by_day[log.date.weekday()] += 1
+        expected_count = test_habit.logs.count()
+        expected_rate = round((expected_count / 61) * 100)
+
+        assert habit_stats(test_habit) == (expected_count, expected_rate, expected_by_day)
+        habit_id = test_habit.id
+
+    response = client.get(f'/stats/{habit_id}')
+    assert f'Total count: {expected_count}'.encode() in response.data
+    assert f'Monday: {expected_by_day[0]}'.encode() in response.data
+
+
+### Test home page uses the same number of queries no matter how many habits and friends a user has ###
+@pytest.mark.parametrize('size', [1, 25])
+def test_home_query_count(client, auth, count_queries, size):
+    # Log in tester
+    auth.login('tester', '12345678')
+
+    with app.app_context():
+        tester = User.query.filter_by(username= 'tester').first()
+        for number in range(size):
+            friend = User(username= f'friend{number}', password= '12345678')
+            tester.followed.append(friend)
+            db.session.add(Habit(name= f'habit{number}', user_id= tester.id, date_created= date.today()))
+        db.session.commit()
+
+    response, statements = count_queries(lambda: client.get('/'))
+
+    assert response.status_code == 200
+    assert f'habit{size - 1}'.encode() in response.data
+    assert f'friend{size - 1}'.encode() in response.data
+    # One query for the user and their habits, one for their friends
+    assert len(statements) == 2
+    # Password hashes are never loaded
+    assert not any('password' in statement for statement in statements)
+
+
+### Test many concurrent completions of one habit give an exact streak and one log per day ###
+def test_concurrent_completions(tmp_path):
+    # Threads need a real database file so each gets its own connection
+    engine = create_engine(f"sqlite:///{tmp_path / 'stress.db'}", connect_args= {'timeout': 30})
+    db.metadata.create_all(engine)
+    Session = sessionmaker(engine)
+
+    start = date.today() - timedelta(days= 4)
+    with Session() as setup:
+        tester = User(username= 'tester', password= '12345678')
+        setup.add(tester)
+        setup.flush()
+        test_habit = Habit(name= 'gym', user_id= tester.id, date_created= start)
+        setup.add(test_habit)
+        setup.commit()
+        tester_id, habit_id = tester.id, test_habit.id
+
+    def click(day, results):
+        with Session() as worker:
+            results.append(complete_habit(worker, habit_id, tester_id, day))
+            worker.commit()
+
+    # Hammer the habit from 8 threads on each of 5 consecutive days
+    for days_ago in range(4, -1, -1):
+        results = []
+        threads = [threading.Thread(target= click, args= (date.today() - timedelta(days= days_ago), results))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Exactly one click per day counts
+        assert results.count('gym') == 1
+        assert results.count(None) == 7
+
+    with Session() as check:
+        habit = check.get(Habit, habit_id)
+        assert habit.streak == 5
+        assert habit.last_done == date.today()
+        assert check.query(ActivityLog).filter_by(habit_id= habit_id).count() == 5
+    engine.dispose()
+
+
+### Test current streak decays once a day is missed, in Python and in SQL ###
+@pytest.mark.parametrize(('days_ago', 'expected_streak'), [(0, 7), (1, 7), (2, 0), (None, 0)])
+def test_current_streak(client, days_ago, expected_streak):
+    tester = User(username= 'tester', password= '12345678')
+    db.session.add(tester)
+    db.session.commit()
+    last_done = None if days_ago is None else date.today() - timedelta(days= days_ago)
+    test_habit = Habit(name= 'gym', user_id= tester.id, date_created= date.today() - timedelta(days= 30),
+                       last_done= last_done, streak= 7)
+    db.session.add(test_habit)
+    db.session.commit()
+
+    assert test_habit.current_streak == expected_streak
+    assert db.session.query(Habit.current_streak).scalar() == expected_streak
+
+
+### Test streaks and last_done are rebuilt from logs ###
+def test_reconcile_streaks(client):
+    today = date.today()
+    tester = User(username= 'tester', password= '12345678')
+    db.session.add(tester)
+    db.session.commit()
+
+    # Habit names describe the logs each habit gets
+    habits = {name: Habit(name= name, user_id= tester.id, date_created= today - timedelta(days= 20), streak= 9)
+              for name in ['three_in_a_row', 'gap', 'no_logs', 'correct']}
+    db.session.add_all(habits.values())
+    db.session.commit()
+    for days_ago in [10, 2, 1, 0]:
+        db.session.add(ActivityLog(habit_id= habits['three_in_a_row'].id, date= today - timedelta(days= days_ago)))
+    for days_ago in [5, 4, 2]:
+        db.session.add(ActivityLog(habit_id= habits['gap'].id, date= today - timedelta(days= days_ago)))
+    db.session.add(ActivityLog(habit_id= habits['correct'].id, date= today))
+    habits['correct'].streak = 1
+    habits['correct'].last_done = today
+    db.session.commit()
+
+    # Small chunks so habits are split across several batches
+    versions = (tester.version, habits['gap'].version, habits['correct'].version)
+    assert reconcile_streaks(db.session, chunk_size= 3) == 3
+
+    db.session.expire_all()
+    # Repaired habits and their owner get new versions, so cached pages and ETags are refreshed
+    assert (tester.version, habits['gap'].version, habits['correct'].version) == (versions[0] + 1, versions[1] + 1,
+                                                                                 versions[2])
+    assert (habits['three_in_a_row'].streak, habits['three_in_a_row'].last_done) == (3, today)
+    assert (habits['gap'].streak, habits['gap'].last_done) == (1, today - timedelta(days= 2))
+    assert (habits['no_logs'].streak, habits['no_logs'].last_done) == (0, None)
+    assert (habits['correct'].streak, habits['correct'].last_done) == (1, today)
+
+
+### Test deleting a habit with a long history deletes its logs without touching them one by one ###
+def test_delete_habit_single_statement(client, auth, count_queries):
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+
+    with app.app_context():
+        habit = Habit.query.filter_by(name= 'gym').first()
+        habit_id = habit.id
+        for days_ago in range(100):
+            db.session.add(ActivityLog(habit_id= habit_id, date= date.today() - timedelta(days= days_ago)))
+        db.session.commit()
+
+    _, statements = count_queries(lambda: client.post(f'/delete/{habit_id}'))
+
+    # One DELETE for the habit and its logs, then the owner's version bump and the tombstone for /api/v1/sync
+    assert len(statements) == 4
+    assert statements[0].startswith('DELETE FROM habit')
+    assert not any('activity_log' in statement for statement in statements)
+    with app.app_context():
+        assert Habit.query.count() == 0
+        assert ActivityLog.query.count() == 0
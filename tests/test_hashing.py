@@ -0,0 +1,75 @@
+from app import User
+from hashing import hasher, PasswordHasher
+import pytest
+
+FAST_METHOD = "pbkdf2:sha256:1000"
+
+
+# Put the app's hasher back the way the tests expect it
+@pytest.fixture()
+def restore_hasher():
+    method, workers, queue_depth = hasher.method, hasher.workers, hasher.queue_depth
+    yield hasher
+    hasher.configure(method, workers, queue_depth)
+
+
+### Test hashes made with old parameters are upgraded on the next successful login ###
+def test_rehash_on_login(client, auth, restore_hasher):
+    auth.login('tester', '12345678')
+    old_hash = User.query.filter_by(username= 'tester').first().password
+    assert old_hash.startswith('scrypt:')
+
+    hasher.configure(FAST_METHOD, 0)
+    client.get('/logout')
+    # A wrong password leaves the hash alone
+    client.post('/login', data={'username': 'tester', 'password': 'wrong-password'})
+    assert User.query.filter_by(username= 'tester').first().password == old_hash
+
+    client.post('/login', data={'username': 'tester', 'password': '12345678'})
+    new_hash = User.query.filter_by(username= 'tester').first().password
+    assert new_hash.startswith(FAST_METHOD + '$')
+
+    # The upgraded hash still logs the user in
+    client.get('/logout')
+    response = client.post('/login', data={'username': 'tester', 'password': '12345678'})
+    assert response.headers['Location'] == '/'
+
+
+### Test short method names match the full parameters werkzeug stores, so logins do not rehash every time ###
+def test_short_method_names(restore_hasher):
+    hasher.configure("pbkdf2:sha256", 0)
+    stored_hash = hasher.hash('12345678')
+    assert stored_hash.startswith('pbkdf2:sha256:1000000$')
+    assert not hasher.needs_rehash(stored_hash)
+    assert hasher.needs_rehash(stored_hash.replace('1000000', '600000', 1))
+
+
+### Test hashes computed in worker processes ###
+def test_process_pool():
+    pool_hasher = PasswordHasher()
+    pool_hasher.configure(FAST_METHOD, 1)
+    try:
+        stored_hash = pool_hasher.hash('12345678')
+        assert pool_hasher.verify(stored_hash, '12345678')
+        assert not pool_hasher.verify(stored_hash, 'wrong-password')
+        assert not pool_hasher.needs_rehash(stored_hash)
+        # Pool processes are spawned, never forked from the threaded server
+        assert pool_hasher.pool._mp_context.get_start_method() == 'spawn'
+    finally:
+        pool_hasher.configure(FAST_METHOD, 0)
+
+
+### Test logins are turned away with 503 and Retry-After when the pool is full ###
+def test_pool_saturated(client, auth, restore_hasher):
+    auth.login('tester', '12345678')
+    client.get('/logout')
+
+    hasher.configure(FAST_METHOD, 1, queue_depth= 1)
+    hasher.slots.acquire()
+    try:
+        response = client.post('/login', data={'username': 'tester', 'password': '12345678'})
+    finally:
+        hasher.slots.release()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert hasher.rejected >= 1
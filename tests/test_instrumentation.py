@@ -0,0 +1,77 @@
+from app import app, instrumentation
+import logging
+import pytest
+
+
+# Switch instrumentation on for a test and clear metrics from earlier tests
+@pytest.fixture()
+def instrumented(client):
+    app.config['SQL_INSTRUMENTATION'] = True
+    app.config['METRICS_TOKEN'] = 'scraper-token'
+    instrumentation.reset()
+    yield client
+    app.config['SQL_INSTRUMENTATION'] = False
+    app.config['METRICS_TOKEN'] = None
+
+
+# Fetch /metrics as the scraper
+def scrape(client):
+    return client.get('/metrics', headers={'Authorization': 'Bearer scraper-token'})
+
+
+### Test /metrics is hidden unless instrumentation is switched on ###
+def test_metrics_disabled(client):
+    response = client.get('/metrics')
+    assert response.status_code == 404
+
+
+### Test /metrics needs the token, and is not served at all without one configured ###
+def test_metrics_token(instrumented):
+    assert instrumented.get('/metrics').status_code == 401
+    assert instrumented.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert scrape(instrumented).status_code == 200
+
+    app.config['METRICS_TOKEN'] = None
+    assert scrape(instrumented).status_code == 404
+
+
+### Test query counts and timings are recorded per endpoint ###
+def test_metrics_per_endpoint(instrumented, auth):
+    auth.login('tester', '12345678')
+    instrumented.get('/')
+    instrumented.get('/')
+
+    response = scrape(instrumented)
+    body = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'habittracker_requests_total{endpoint="home"} 2' in body
+    # Home page issues two statements, then one once its lists are cached
+    assert 'habittracker_db_queries_total{endpoint="home"} 3' in body
+    assert 'habittracker_request_queries_bucket{endpoint="home",le="2"} 2' in body
+    assert 'habittracker_render_seconds_count{endpoint="home"} 2' in body
+    assert 'habittracker_slowest_query_seconds{endpoint="home",rank="1"' in body
+
+
+### Test statements over the threshold are written to the slow-query log ###
+def test_slow_query_log(instrumented, auth, caplog):
+    auth.login('tester', '12345678')
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+    try:
+        with caplog.at_level(logging.WARNING, logger='habittracker.slow_queries'):
+            instrumented.get('/')
+    finally:
+        app.config['SLOW_QUERY_THRESHOLD_MS'] = 100
+
+    assert len(caplog.records) == 2
+    assert '"endpoint": "home"' in caplog.records[0].getMessage()
+    assert '12345678' not in caplog.text
+
+
+### Test fragment cache hits and misses are exposed ###
+def test_metrics_cache_counters(instrumented, auth):
+    auth.login('tester', '12345678')
+    instrumented.get('/')
+
+    body = scrape(instrumented).get_data(as_text=True)
+    assert 'habittracker_cache_hits_total{backend="memory"}' in body
+    assert 'habittracker_cache_misses_total{backend="memory"}' in body
@@ -0,0 +1,99 @@
+from app import db, User, Habit, ActivityLog, LeaderboardEntry, LeaderboardScore, rebuild_leaderboard
+from leaderboard import record_day, standing, score_from_days, EMPTY_SCORE
+from datetime import date, timedelta
+
+
+### Test scores extend streaks on consecutive days and restart after a gap ###
+def test_record_day():
+    today = date(2026, 3, 10)
+    score = record_day(EMPTY_SCORE, today - timedelta(days= 2))
+    score = record_day(score, today - timedelta(days= 1))
+    assert record_day(score, today - timedelta(days= 1)) == score
+    score = record_day(score, today)
+    assert score == (3, today, 0b111)
+    assert standing(score, today) == (3, 10)
+
+    # Two days later the streak is broken but the active days still count
+    assert standing(score, today + timedelta(days= 2)) == (0, 10)
+    # Days slide out of the 30-day window
+    assert standing(score, today + timedelta(days= 28)) == (0, 7)
+    assert standing(score, today + timedelta(days= 29)) == (0, 3)
+    assert standing(score, today + timedelta(days= 30)) == (0, 0)
+
+    score = record_day(score, today + timedelta(days= 5))
+    assert score == (1, today + timedelta(days= 5), 0b11100001)
+    assert score_from_days([today, today - timedelta(days= 1)]) == (2, today, 0b11)
+
+
+# Register a user who adds one habit and completes it (on today's date)
+def user_completes_habit(client, auth, username):
+    auth.login(username, '12345678')
+    client.post('/', data={'new_habit': f'{username}_habit'})
+    habit_id = Habit.query.filter_by(name= f'{username}_habit').first().id
+    client.post(f'/done/{habit_id}')
+    client.get('/logout')
+
+
+### Test the leaderboard ranks followed accounts without reading habits or logs ###
+def test_leaderboard_page(client, auth, count_queries):
+    user_completes_habit(client, auth, 'bill')
+    auth.login('anna', '12345678')
+    client.get('/logout')
+    # Bill was active yesterday and the day before as well
+    db.session.execute(LeaderboardScore.__table__.update().values(streak= 3, recent_days= 0b111))
+    db.session.commit()
+
+    auth.login('tester', '12345678')
+    client.post('/follow/anna')
+    client.post('/follow/bill')
+    entries = LeaderboardEntry.query.filter_by(user_id= User.query.filter_by(username= 'tester').first().id).all()
+    assert len(entries) == 2
+
+    response, statements = count_queries(lambda: client.get('/leaderboard'))
+    assert response.status_code == 200
+    assert response.data.index(b'bill') < response.data.index(b'anna')
+    assert b'3 day streak, active 10% of the last 30 days' in response.data
+    assert not any('activity_log' in statement or 'habit' in statement for statement in statements)
+
+
+### Test completing a habit updates every leaderboard showing the user ###
+def test_mark_done_updates_followers(client, auth):
+    auth.login('bill', '12345678')
+    client.post('/', data={'new_habit': 'bills_habit'})
+    client.get('/logout')
+    auth.login('tester', '12345678')
+    client.post('/follow/bill')
+    client.get('/logout')
+
+    client.post('/login', data={'username': 'bill', 'password': '12345678'})
+    habit_id = Habit.query.filter_by(name= 'bills_habit').first().id
+    client.post(f'/done/{habit_id}')
+
+    entry = LeaderboardEntry.query.one()
+    assert (entry.streak, entry.last_done, entry.recent_days) == (1, date.today(), 1)
+
+
+### Test unfollowing removes the account from the leaderboard ###
+def test_unfollow_removes_entry(client, auth):
+    user_completes_habit(client, auth, 'bill')
+    auth.login('tester', '12345678')
+    client.post('/follow/bill')
+    assert LeaderboardEntry.query.count() == 1
+    client.post('/unfollow/bill')
+    assert LeaderboardEntry.query.count() == 0
+
+
+### Test rebuilding from the logs gives the same scores as incremental updates ###
+def test_rebuild_leaderboard(client, auth):
+    user_completes_habit(client, auth, 'bill')
+    auth.login('tester', '12345678')
+    client.post('/follow/bill')
+    bill_habit = Habit.query.filter_by(name= 'bill_habit').first()
+    db.session.add_all([ActivityLog(habit_id= bill_habit.id, date= date.today() - timedelta(days= days))
+                        for days in [1, 2, 5]])
+    db.session.commit()
+
+    rebuild_leaderboard(db.session, chunk_size= 1)
+    entry = LeaderboardEntry.query.one()
+    assert (entry.streak, entry.last_done, entry.recent_days) == (3, date.today(), 0b100111)
+    assert LeaderboardScore.query.count() == 1
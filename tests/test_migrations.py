@@ -0,0 +1,97 @@
+from migrations import upgrade
+from sqlalchemy import create_engine, inspect, text
+
+
+# Schema as created by the first release, before any migrations
+OLD_SCHEMA = [
+    'CREATE TABLE "user" (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(150) NOT NULL UNIQUE, '
+    'password VARCHAR(255) NOT NULL)',
+    'CREATE TABLE followers (follower_id INTEGER REFERENCES "user" (id), followed_id INTEGER REFERENCES "user" (id))',
+    'CREATE TABLE habit (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL, '
+    'user_id INTEGER NOT NULL REFERENCES "user" (id), last_done DATE, streak INTEGER NOT NULL, date_created DATE NOT NULL)',
+    'CREATE TABLE activity_log (id INTEGER NOT NULL PRIMARY KEY, habit_id INTEGER NOT NULL REFERENCES habit (id), date DATE)',
+]
+
+
+# Create a database file with the old schema and some duplicate logs
+def make_old_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        for statement in OLD_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO \"user\" (id, username, password) VALUES (1, 'tester', 'x')"))
+        connection.execute(text("INSERT INTO habit (id, name, user_id, streak, date_created) "
+                                "VALUES (1, 'gym', 1, 0, '2026-01-01'), (2, 'read', 1, 0, '2026-01-01')"))
+        connection.execute(text("INSERT INTO activity_log (id, habit_id, date) VALUES "
+                                "(1, 1, '2026-01-01'), (2, 1, '2026-01-01'), (3, 1, '2026-01-02'), "
+                                "(4, 2, '2026-01-01'), (5, 1, '2026-01-01'), (6, 2, '2026-01-01'), (7, 2, '2026-01-03')"))
+    return engine
+
+
+### Test duplicate logs are removed in chunks and the oldest log is kept ###
+def test_upgrade_removes_duplicate_logs(tmp_path):
+    engine = make_old_database(tmp_path)
+    upgrade(engine, chunk_size= 2, log= lambda message: None)
+
+    with engine.connect() as connection:
+        ids = connection.execute(text("SELECT id FROM activity_log ORDER BY id")).scalars().all()
+    assert ids == [1, 3, 4, 7]
+
+
+### Test case-duplicate usernames are renamed, oldest first, before the lower(username) index is created ###
+def test_upgrade_renames_case_duplicate_usernames(tmp_path):
+    engine = make_old_database(tmp_path)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO \"user\" (id, username, password) VALUES "
+                                "(2, 'Tester', 'x'), (3, 'TESTER', 'x'), (4, 'tester3', 'x')"))
+    messages = []
+    upgrade(engine, log= messages.append)
+
+    with engine.connect() as connection:
+        usernames = connection.execute(text('SELECT username FROM "user" ORDER BY id')).scalars().all()
+    assert usernames == ['tester', 'Tester2', 'TESTER31', 'tester3']
+    assert 'Renamed user 2 from Tester to Tester2' in messages
+
+
+### Test indexes are created and migrations only run once ###
+def test_upgrade_adds_indexes(tmp_path):
+    engine = make_old_database(tmp_path)
+    upgrade(engine, log= lambda message: None)
+
+    indexes = {index['name']: index for table in ['habit', 'followers', 'activity_log']
+               for index in inspect(engine).get_indexes(table)}
+    assert 'ix_habit_user_id' in indexes
+    assert 'ix_followers_follower_id' in indexes
+    assert 'ix_followers_followed_id' in indexes
+    assert indexes['ix_activity_log_habit_id_date']['unique']
+    assert 'ix_activity_log_habit_id_id' in indexes
+    assert 'ix_activity_log_dedupe_tmp' not in indexes
+
+    # Expression indexes are not reported by the inspector on SQLite
+    with engine.connect() as connection:
+        username_index = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'ix_user_username_lower'")).scalar()
+    assert 'UNIQUE' in username_index
+
+    # Version counters are added with a default for existing rows
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT version FROM habit WHERE id = 1")).scalar() == 1
+        assert connection.execute(text('SELECT version FROM "user" WHERE id = 1')).scalar() == 1
+        assert connection.execute(text('SELECT celebrity FROM "user" WHERE id = 1')).scalar() == 0
+        assert connection.execute(text('SELECT change_seq FROM "user" WHERE id = 1')).scalar() == 0
+
+    # Bitmap and roll-up tables start empty
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM activity_bitmap")).scalar() == 0
+        assert connection.execute(text("SELECT COUNT(*) FROM activity_rollup")).scalar() == 0
+        assert connection.execute(text("SELECT COUNT(*) FROM activity_log_archive")).scalar() == 0
+
+    # The archive assigns its own ids, as rollup_activity expects
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO activity_log_archive (habit_id, date) SELECT habit_id, date FROM activity_log"))
+        assert connection.execute(text("SELECT COUNT(*) FROM activity_log_archive WHERE id IS NOT NULL")).scalar() == 4
+        connection.execute(text("DELETE FROM activity_log_archive"))
+
+    # Running again should not apply anything
+    messages = []
+    upgrade(engine, log= messages.append)
+    assert messages == []
@@ -0,0 +1,100 @@
+from app import app, trust_proxies
+from ratelimit import limiter, take_token, SQLiteBuckets, MemoryBuckets
+
+
+### Test buckets refill over time and report how long to wait when empty ###
+def test_take_token():
+    # A new bucket starts full
+    assert take_token(None, None, 10, 1, 100) == (9, 0)
+    # An empty bucket needs one second per token at 1 token/second
+    assert take_token(0, 100, 10, 1, 100.5) == (0.5, 0.5)
+    # Refilling stops at capacity
+    assert take_token(2, 0, 10, 1, 1000) == (9, 0)
+
+
+### Test repeated logins for one username are answered with 429 and Retry-After ###
+def test_login_limited_per_username(client, auth):
+    auth.login('tester', '12345678')
+    client.get('/logout')
+    for _ in range(9):
+        response = client.post('/login', data={'username': 'tester', 'password': 'wrong-password'})
+        assert response.status_code == 200
+
+    response = client.post('/login', data={'username': 'TESTER', 'password': '12345678'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+    # Other usernames are not affected
+    response = client.post('/login', data={'username': 'bill', 'password': 'wrong-password'})
+    assert response.status_code == 200
+
+    # Showing the login form is never limited
+    assert client.get('/login').status_code == 200
+
+
+### Test registrations are limited per IP address ###
+def test_register_limited_per_ip(client):
+    for number in range(10):
+        client.post('/register', data={'username': f'user{number}', 'password': '12345678'})
+    response = client.post('/register', data={'username': 'onemore', 'password': '12345678'})
+    assert response.status_code == 429
+
+    # Another address still has its own bucket
+    response = client.post('/register', data={'username': 'onemore', 'password': '12345678'},
+                           environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert response.status_code == 302
+
+
+### Test behind a trusted proxy each client gets its own bucket, keyed on X-Forwarded-For ###
+def test_register_limited_per_forwarded_ip(client):
+    wsgi_app = app.wsgi_app
+    trust_proxies(1)
+    try:
+        for number in range(10):
+            client.post('/register', data={'username': f'user{number}', 'password': '12345678'},
+                        headers={'X-Forwarded-For': '203.0.113.1'})
+        response = client.post('/register', data={'username': 'onemore', 'password': '12345678'},
+                               headers={'X-Forwarded-For': '203.0.113.1'})
+        assert response.status_code == 429
+
+        # Another client behind the same proxy is not affected
+        response = client.post('/register', data={'username': 'onemore', 'password': '12345678'},
+                               headers={'X-Forwarded-For': '203.0.113.2'})
+        assert response.status_code == 302
+    finally:
+        app.wsgi_app = wsgi_app
+
+
+### Test limits can be switched off ###
+def test_limiter_disabled(client, auth):
+    app.config['RATELIMIT_ENABLED'] = False
+    try:
+        auth.login('tester', '12345678')
+        for _ in range(15):
+            response = client.post('/login', data={'username': 'tester', 'password': 'wrong-password'})
+            assert response.status_code == 200
+    finally:
+        app.config['RATELIMIT_ENABLED'] = True
+
+
+### Test the SQLite backend shares buckets between workers ###
+def test_sqlite_buckets_shared(tmp_path):
+    path = str(tmp_path / 'ratelimit.db')
+    first_worker, second_worker = SQLiteBuckets(path), SQLiteBuckets(path)
+    assert first_worker.take('login:ip:1.2.3.4', 2, 0.01) == 0
+    assert second_worker.take('login:ip:1.2.3.4', 2, 0.01) == 0
+    assert first_worker.take('login:ip:1.2.3.4', 2, 0.01) > 0
+
+    # The in-process backend keeps buckets per worker
+    assert MemoryBuckets().take('login:ip:1.2.3.4', 2, 0.01) == 0
+
+
+### Test limiter counters are exported for /metrics ###
+def test_limiter_metrics(client, auth):
+    auth.login('tester', '12345678')
+    for _ in range(10):
+        client.post('/login', data={'username': 'tester', 'password': 'wrong-password'})
+
+    metrics = limiter.metrics()
+    assert 'habittracker_ratelimit_allowed_total{route="login"} 10' in metrics
+    assert 'habittracker_ratelimit_limited_total{route="login",key="username"} 1' in metrics
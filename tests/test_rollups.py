@@ -0,0 +1,110 @@
+from app import app, db, User, Habit, ActivityLog, ActivityRollup, ActivityLogArchive, habit_stats, rollup_activity, reconcile_streaks
+from migrations import backfill_activity_bitmaps
+from datetime import date, timedelta
+
+
+# A habit created 500 days ago with a log on each of the given days ago
+def make_habit(days_ago):
+    tester = User(username= 'tester', password= '12345678')
+    db.session.add(tester)
+    db.session.commit()
+    habit = Habit(name= 'gym', user_id= tester.id, date_created= date.today() - timedelta(days= 500))
+    db.session.add(habit)
+    db.session.commit()
+    db.session.add_all([ActivityLog(habit_id= habit.id, date= date.today() - timedelta(days= days)) for days in days_ago])
+    db.session.commit()
+    return habit
+
+
+### Test stats are unchanged after old logs are rolled up and archived ###
+def test_rollup_keeps_stats(client):
+    habit = make_habit(range(0, 500, 2))
+    before = habit_stats(habit)
+
+    archived = rollup_activity(db.session, retention_days= 90)
+    cutoff = (date.today() - timedelta(days= 90)).replace(day= 1)
+    assert archived == ActivityLogArchive.query.count() > 0
+    assert ActivityLog.query.filter(ActivityLog.date < cutoff).count() == 0
+    assert ActivityLog.query.count() + archived == 250
+    # Whole months only, at most 7 rows each
+    assert ActivityRollup.query.count() <= 7 * 17
+    assert habit_stats(habit) == before
+
+    # Running again has nothing new to do
+    assert rollup_activity(db.session, retention_days= 90) == 0
+    assert habit_stats(habit) == before
+
+
+### Test logs backfilled into a month that was already rolled up are added to it ###
+def test_rollup_adds_to_existing_months(client):
+    habit = make_habit([200])
+    rollup_activity(db.session, retention_days= 90)
+
+    db.session.add(ActivityLog(habit_id= habit.id, date= date.today() - timedelta(days= 200) + timedelta(days= 7)))
+    db.session.commit()
+    before = habit_stats(habit)
+    assert before[0] == 2
+
+    rollup_activity(db.session, retention_days= 90)
+    assert habit_stats(habit) == before
+
+
+### Test stats read a bounded number of rows no matter how old the habit is ###
+def test_stats_rows_bounded(client):
+    habit = make_habit(range(0, 500))
+    rollup_activity(db.session, retention_days= 30)
+
+    # At most two months of live logs, and a row per weekday for each older month
+    assert ActivityLog.query.count() <= 62
+    assert ActivityRollup.query.count() <= 7 * 17
+    assert habit_stats(habit)[0] == 500
+
+
+### Test streaks are rebuilt from archived logs too ###
+def test_reconcile_reads_archive(client):
+    habit = make_habit(range(0, 200))
+    rollup_activity(db.session, retention_days= 30)
+    habit.streak = 1
+    db.session.commit()
+
+    assert reconcile_streaks(db.session) == 1
+    db.session.expire_all()
+    assert (habit.streak, habit.last_done) == (200, date.today())
+
+
+### Test bitmaps backfilled after a roll-up include the archived days ###
+def test_backfill_bitmaps_reads_archive(client):
+    habit = make_habit(range(0, 500, 2))
+    before = habit_stats(habit)
+    rollup_activity(db.session, retention_days= 90)
+    # A day already archived and logged again is only counted once
+    db.session.add(ActivityLog(habit_id= habit.id, date= date.today() - timedelta(days= 200)))
+    db.session.commit()
+
+    backfill_activity_bitmaps(db.engine, chunk_size= 1, log= lambda message: None)
+    app.config['ACTIVITY_STORAGE'] = 'bitmap'
+    try:
+        assert habit_stats(habit) == before
+        assert habit_stats(habit)[0] == 250
+    finally:
+        app.config['ACTIVITY_STORAGE'] = 'log'
+
+
+### Test the command rolls up logs older than the configured retention ###
+def test_rollup_command(client):
+    make_habit([0, 300])
+    result = app.test_cli_runner().invoke(args= ['rollup-activity', '--retention-days', '60'])
+    assert 'Archived 1 activity logs' in result.output
+    assert ActivityLog.query.count() == 1
+
+
+### Test deleting a habit deletes its roll-ups and archived logs ###
+def test_delete_habit_removes_rollups(client):
+    habit = make_habit([0, 300])
+    rollup_activity(db.session, retention_days= 60)
+    with client.session_transaction() as sess:
+        sess['user_id'] = habit.user_id
+
+    client.post(f'/delete/{habit.id}')
+    assert ActivityRollup.query.count() == 0
+    assert ActivityLogArchive.query.count() == 0
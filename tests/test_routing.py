@@ -0,0 +1,92 @@
+from app import app, db, User, Habit, cache, home_habits_key, friends_fragment_key
+from routing import replicas
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from datetime import date
+import pytest
+
+
+# Start each request with an empty identity map, as a real server would
+def fresh_get(client, path):
+    db.session.remove()
+    cache.clear()
+    return client.get(path)
+
+
+# Stand up a replica database file holding different data from the primary, so reads show where they went
+@pytest.fixture()
+def replica(client, tmp_path):
+    uri = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(uri)
+    db.metadata.create_all(engine)
+    with Session(engine) as replica_session:
+        replica_session.add(User(id= 1, username= 'tester', password= '12345678'))
+        replica_session.add(Habit(name= 'from_replica', user_id= 1, date_created= date.today()))
+        replica_session.commit()
+    engine.dispose()
+
+    replicas.configure([uri])
+    yield client
+    replicas.configure([])
+
+
+### Test read-only views read from the replica and writes go to the primary ###
+def test_reads_use_replica(replica):
+    db.session.add(User(id= 1, username= 'tester', password= '12345678'))
+    db.session.commit()
+    with replica.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    assert b'from_replica' in fresh_get(replica, '/').data
+
+    # Adding a habit is a write -- it lands on the primary only
+    db.session.remove()
+    replica.post('/', data={'new_habit': 'from_primary'})
+    assert Habit.query.filter_by(name= 'from_primary').count() == 1
+    assert Habit.query.filter_by(name= 'from_replica').count() == 0
+
+
+### Test a client reads from the primary for a short time after its own write ###
+def test_read_your_writes(replica):
+    db.session.add(User(id= 1, username= 'tester', password= '12345678'))
+    db.session.commit()
+    with replica.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    replica.post('/', data={'new_habit': 'from_primary'})
+    response = fresh_get(replica, '/')
+    assert b'from_primary' in response.data
+    assert b'from_replica' not in response.data
+
+    # Once the window has passed reads go back to the replica
+    app.config['REPLICA_STICKY_SECONDS'] = 0
+    try:
+        assert b'from_replica' in fresh_get(replica, '/').data
+    finally:
+        app.config['REPLICA_STICKY_SECONDS'] = 5
+
+
+### Test everything uses the primary when no replicas are configured ###
+def test_no_replicas(client, auth):
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    assert b'gym' in fresh_get(client, '/').data
+
+
+### Test lists read from a replica are not cached, so a lagging replica cannot leave them stale ###
+def test_replica_reads_not_cached(replica):
+    db.session.add(User(id= 1, username= 'tester', password= '12345678'))
+    db.session.commit()
+    with replica.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    db.session.remove()
+    cache.clear()
+    assert b'from_replica' in replica.get('/').data
+    assert cache.get(home_habits_key(1, 1, date.today())) is None
+    assert cache.get(friends_fragment_key(1, 1)) is None
+
+    # Without replicas the lists are cached as before
+    replicas.configure([])
+    replica.get('/')
+    assert cache.get(home_habits_key(1, 1, date.today())) is not None
@@ -0,0 +1,183 @@
+from app import app, db, User, Habit, ActivityLog, ChangeLog, cache, move_user
+from sharding import shards
+from sqlalchemy import select, func, inspect, text
+import pytest
+
+
+# Spread habits over two SQLite shard files for the test
+@pytest.fixture()
+def sharded(client, tmp_path):
+    shards.configure([f"sqlite:///{tmp_path / 'shard0.db'}", f"sqlite:///{tmp_path / 'shard1.db'}"])
+    shards.create_all(db.metadata)
+    yield client
+    shards.configure([])
+
+
+# Count a user's habits on one shard, straight from the shard database
+def habits_on_shard(shard, user_id):
+    with shards.engines[shard].connect() as connection:
+        return connection.execute(select(func.count()).select_from(Habit.__table__)
+                                  .where(Habit.__table__.c.user_id == user_id)).scalar()
+
+
+# Start each request with an empty identity map, as a real server would
+def fresh(client, method, path, **kwargs):
+    db.session.remove()
+    cache.clear()
+    return client.open(path, method=method, **kwargs)
+
+
+### Test each user's habits and logs are stored on their own shard and the routes work across shards ###
+def test_routes_on_shards(sharded, auth):
+    # User ids 1 and 2 are placed on shards 1 and 0
+    auth.login('bill', '12345678')
+    fresh(sharded, 'POST', '/', data={'new_habit': 'bills_habit'})
+    sharded.get('/logout')
+    auth.login('tester', '12345678')
+    fresh(sharded, 'POST', '/', data={'new_habit': 'testers_habit'})
+
+    bill = User.query.filter_by(username= 'bill').first()
+    tester = User.query.filter_by(username= 'tester').first()
+    assert (bill.shard, tester.shard) == (1, 0)
+    assert habits_on_shard(1, bill.id) == 1
+    assert habits_on_shard(0, tester.id) == 1
+    # Nothing is stored on the primary
+    with db.engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(Habit.__table__)).scalar() == 0
+
+    response = fresh(sharded, 'GET', '/')
+    assert b'testers_habit' in response.data
+    assert b'bills_habit' not in response.data
+
+    # Complete and view stats on tester's shard
+    with shards.using(0):
+        habit_id = db.session.execute(select(Habit.id)).scalar()
+    fresh(sharded, 'POST', f'/done/{habit_id}')
+    assert b'Total count: 1' in fresh(sharded, 'GET', f'/stats/{habit_id}').data
+
+    # Bill's profile is read from bill's shard
+    fresh(sharded, 'POST', '/follow/bill')
+    response = fresh(sharded, 'GET', '/profile/bill')
+    assert b'bills_habit' in response.data
+
+    # Deleting removes the habit and its log from tester's shard
+    fresh(sharded, 'POST', f'/delete/{habit_id}')
+    assert habits_on_shard(0, tester.id) == 0
+
+
+### Test rebalancing moves a user's habits and logs to another shard ###
+def test_move_user(sharded, auth):
+    auth.login('tester', '12345678')
+    fresh(sharded, 'POST', '/', data={'new_habit': 'gym'})
+    fresh(sharded, 'POST', '/', data={'new_habit': 'read'})
+    tester = User.query.filter_by(username= 'tester').first()
+    with shards.using(tester.shard):
+        habit_id = db.session.execute(select(Habit.id).where(Habit.name == 'gym')).scalar()
+    fresh(sharded, 'POST', f'/done/{habit_id}')
+    cursor = fresh(sharded, 'GET', '/api/v1/sync').get_json()["cursor"]
+    with shards.using(tester.shard):
+        old_ids = set(db.session.execute(select(Habit.id).where(Habit.user_id == tester.id)).scalars())
+
+    source = tester.shard
+    target = 1 - source
+    db.session.remove()
+    assert move_user(tester.id, target) == 2
+
+    assert habits_on_shard(source, tester.id) == 0
+    assert habits_on_shard(target, tester.id) == 2
+    with shards.engines[target].connect() as connection:
+        assert connection.execute(select(func.count()).select_from(ActivityLog.__table__)).scalar() == 1
+
+    # The user's pages now come from the new shard
+    response = fresh(sharded, 'GET', '/')
+    assert b'gym' in response.data
+    assert b'read' in response.data
+
+    # Synced clients drop the old habit ids and pick up the new ones
+    changes = fresh(sharded, 'GET', f'/api/v1/sync?since={cursor}').get_json()["changes"]
+    with shards.using(target):
+        new_ids = set(db.session.execute(select(Habit.id).where(Habit.user_id == tester.id)).scalars())
+    created = {change["id"]: change["data"]["name"] for change in changes if not change["deleted"]}
+    assert set(created) == new_ids
+    assert sorted(created.values()) == ['gym', 'read']
+    # Ids are only unique per shard, so each old id is logged as a tombstone before the new ids
+    logged = db.session.execute(select(ChangeLog.entity_id, ChangeLog.deleted)
+                                .where(ChangeLog.user_id == tester.id, ChangeLog.seq > cursor)
+                                .order_by(ChangeLog.seq)).all()
+    assert sorted(logged[:2]) == sorted((old_id, True) for old_id in old_ids)
+    assert sorted(logged[2:]) == sorted((new_id, False) for new_id in new_ids)
+
+
+### Test 'flask migrate' upgrades the sharded tables on every shard and records it per shard ###
+def test_migrate_upgrades_shards(sharded):
+    # A shard created before the cursor index existed
+    with shards.engines[0].begin() as connection:
+        connection.execute(text("DROP INDEX ix_activity_log_habit_id_id"))
+
+    result = app.test_cli_runner().invoke(args= ['migrate'])
+    assert result.exit_code == 0
+
+    for engine in shards.engines:
+        indexes = {index["name"] for index in inspect(engine).get_indexes("activity_log")}
+        assert "ix_activity_log_habit_id_id" in indexes
+        with engine.connect() as connection:
+            applied = set(connection.execute(text("SELECT name FROM schema_migrations")).scalars())
+        assert applied == {"add_activity_bitmaps", "add_activity_rollups", "add_activity_log_cursor_index"}
+
+
+### Test 'flask shard-habits' moves the habits of an existing deployment from the primary to the shards ###
+def test_shard_primary_habits(client, auth, tmp_path):
+    for name in ['tester', 'bill']:
+        auth.login(name, '12345678')
+        client.post('/', data={'new_habit': f'{name}_habit'})
+        client.post(f'/done/{Habit.query.filter_by(name= f"{name}_habit").first().id}')
+        client.get('/logout')
+
+    shards.configure([f"sqlite:///{tmp_path / 'shard0.db'}", f"sqlite:///{tmp_path / 'shard1.db'}"])
+    try:
+        shards.create_all(db.metadata)
+        result = app.test_cli_runner().invoke(args= ['shard-habits'])
+        assert result.exit_code == 0
+        assert 'Moved 2 habits of 2 users' in result.output
+
+        with db.engine.connect() as primary:
+            assert primary.execute(select(func.count()).select_from(Habit.__table__)).scalar() == 0
+            assert primary.execute(select(func.count()).select_from(ActivityLog.__table__)).scalar() == 0
+        for user in User.query.all():
+            assert habits_on_shard(user.shard, user.id) == 1
+
+        # Pages read the habits from the shards, with their completions
+        auth.login('tester', '12345678')
+        response = fresh(client, 'GET', '/')
+        assert b'tester_habit' in response.data
+        assert b'Completed Today!' in response.data
+
+        # Nothing is left to move the second time
+        assert 'Moved 0 habits of 0 users' in app.test_cli_runner().invoke(args= ['shard-habits']).output
+    finally:
+        shards.configure([])
+
+
+### Test scatter-gather reads rows from every shard ###
+def test_scatter(sharded, auth):
+    for name in ['bill', 'tester', 'anna']:
+        auth.login(name, '12345678')
+        fresh(sharded, 'POST', '/', data={'new_habit': f'{name}_habit'})
+        sharded.get('/logout')
+
+    names = sorted(name for (name,) in shards.scatter(select(Habit.__table__.c.name)))
+    assert names == ['anna_habit', 'bill_habit', 'tester_habit']
+
+
+### Test the friends dashboard gathers habits from every shard ###
+def test_friends_dashboard_on_shards(sharded, auth):
+    for name in ['bill', 'anna']:
+        auth.login(name, '12345678')
+        fresh(sharded, 'POST', '/', data={'new_habit': f'{name}_habit'})
+        sharded.get('/logout')
+    auth.login('tester', '12345678')
+    fresh(sharded, 'POST', '/follow/bill')
+    fresh(sharded, 'POST', '/follow/anna')
+
+    response = fresh(sharded, 'GET', '/friends')
+    assert response.data.index(b'anna_habit') < response.data.index(b'bill_habit')
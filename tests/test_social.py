@@ -1,6 +1,6 @@
 from app import User, app, db, Habit
 import pytest
-from datetime import date
+from datetime import date, timedelta
 
 def test_follow_unfollow(client, auth):
     # Log in tester
@@ -87,7 +87,7 @@ def test_valid_view_profile(client, auth):
         db.session.commit()
         bill_user = User.query.filter_by(username= 'bill').first()
         bill_id = bill_user.id
-        habit = Habit(name='gym', user_id= bill_id, date_created= date.today(), streak= 4)
+        habit = Habit(name='gym', user_id= bill_id, date_created= date.today(), last_done= date.today(), streak= 4)
         db.session.add(habit)
         db.session.commit()
 
@@ -117,3 +117,67 @@ def test_search_functionality(client, auth, search_name, expected_response):
     assert expected_response in response.data
 
 
+
+
+### Test a streak that was not kept up shows as broken on friends profile without changing the database ###
+def test_profile_stale_streak(client, auth):
+    auth.login('tester', '12345678')
+
+    with app.app_context():
+        bill = User(username= 'bill', password= '12345678')
+        db.session.add(bill)
+        db.session.commit()
+        habit = Habit(name='gym', user_id= bill.id, date_created= date.today() - timedelta(days= 50),
+                      last_done= date.today() - timedelta(days= 2), streak= 40)
+        db.session.add(habit)
+        db.session.commit()
+
+    client.post('follow/bill')
+    response = client.get('profile/bill')
+    assert b'0 day streak' in response.data
+
+    # Reads never write -- the stored streak resets when bill next logs the habit
+    with app.app_context():
+        assert Habit.query.filter_by(name= 'gym').first().streak == 40
+
+
+### Test search results are split into pages with a link to the next page ###
+def test_search_pagination(client, auth):
+    auth.login('tester', '12345678')
+
+    with app.app_context():
+        for number in range(25):
+            db.session.add(User(username= f'bill{number:02d}', password= '12345678'))
+        db.session.commit()
+
+    response = client.post('/search', data={'username': 'BILL'})
+    assert response.data.count(b'<li>bill') == 20
+    assert b'bill19' in response.data
+    assert b'bill20' not in response.data
+    assert b'/search?username=bill&amp;after=bill19' in response.data
+
+    response = client.get('/search?username=bill&after=bill19')
+    assert response.data.count(b'<li>bill') == 5
+    assert b'bill24' in response.data
+    assert b'Next page' not in response.data
+
+
+### Test autocomplete suggests usernames by prefix, including users who just registered ###
+def test_autocomplete(client, auth):
+    auth.login('tester', '12345678')
+
+    with app.app_context():
+        for name in ['Bill', 'billy', 'bob', 'abill']:
+            db.session.add(User(username= name, password= '12345678'))
+        db.session.commit()
+
+    response = client.get('/search/autocomplete?q=BI')
+    assert response.get_json() == {'usernames': ['Bill', 'billy']}
+
+    # Registering adds to the loaded index without a reload
+    client.post('/register', data={'username': 'billie', 'password': '12345678'})
+    response = client.get('/search/autocomplete?q=bil')
+    assert response.get_json() == {'usernames': ['Bill', 'billie', 'billy']}
+
+    response = client.get('/search/autocomplete?q=')
+    assert response.get_json() == {'usernames': []}
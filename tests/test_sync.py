@@ -0,0 +1,71 @@
+from app import db, User, Habit, ChangeLog
+from datetime import date
+
+
+def sync(client, since, limit=None):
+    path = f'/api/v1/sync?since={since}' + (f'&limit={limit}' if limit else '')
+    return client.get(path).get_json()
+
+
+### Test changes are numbered per user and only changes after the cursor are returned ###
+def test_sync_changes(client, auth):
+    auth.login('bill', '12345678')
+    client.get('/logout')
+    auth.login('tester', '12345678')
+    assert client.get('/api/v1/sync').get_json() == {'changes': [], 'cursor': 0, 'more': False}
+
+    client.post('/', data={'new_habit': 'gym'})
+    habit_id = Habit.query.filter_by(name= 'gym').first().id
+    client.post(f'/done/{habit_id}')
+    client.post('/follow/bill')
+
+    page = sync(client, 0)
+    assert page['cursor'] == 4
+    assert page['more'] is False
+    # The habit was created and completed -- it is sent once, with its current values
+    assert [(change['seq'], change['type']) for change in page['changes']] == [(2, 'habit'), (3, 'completion'),
+                                                                               (4, 'follow')]
+    assert page['changes'][0]['data'] == {'id': habit_id, 'name': 'gym', 'streak': 1,
+                                          'last_done': date.today().isoformat(),
+                                          'date_created': date.today().isoformat()}
+    assert page['changes'][1]['date'] == date.today().isoformat()
+    assert page['changes'][2]['data'] == {'id': User.query.filter_by(username= 'bill').first().id,
+                                          'username': 'bill'}
+
+    # Nothing new -- the same cursor comes back
+    assert sync(client, 4) == {'changes': [], 'cursor': 4, 'more': False}
+
+    # Pages of changes
+    first_page = sync(client, 0, limit= 2)
+    assert (first_page['cursor'], first_page['more']) == (2, True)
+    assert [change['seq'] for change in sync(client, 2, limit= 2)['changes']] == [3, 4]
+
+    # Other users' changes are numbered separately
+    assert ChangeLog.query.filter_by(user_id= User.query.filter_by(username= 'bill').first().id).count() == 0
+
+
+### Test deletions are sent as tombstones ###
+def test_sync_tombstones(client, auth):
+    auth.login('bill', '12345678')
+    client.get('/logout')
+    auth.login('anna', '12345678')
+    client.get('/logout')
+    auth.login('tester', '12345678')
+    client.post('/', data={'new_habit': 'gym'})
+    habit_id = Habit.query.filter_by(name= 'gym').first().id
+    client.post('/follow/bill')
+    client.post('/follow/anna')
+    cursor = sync(client, 0)['cursor']
+
+    client.post(f'/delete/{habit_id}')
+    client.post('/unfollow/bill')
+    client.get('/logout')
+    client.post('/login', data={'username': 'anna', 'password': '12345678'})
+    client.post('/account/delete')
+    db.session.remove()
+
+    client.post('/login', data={'username': 'tester', 'password': '12345678'})
+    changes = sync(client, cursor)['changes']
+    assert [(change['type'], change['deleted']) for change in changes] == [('habit', True), ('follow', True),
+                                                                            ('follow', True)]
+    assert not any('data' in change for change in changes)